@@ -1,4 +1,5 @@
 import asyncio
+import re
 import sys
 from logging.config import fileConfig
 
@@ -30,10 +31,21 @@ target_metadata = Base.metadata
 
 config.set_main_option("sqlalchemy.url", build_db_uri())
 
+# Tables and views in the database which are managed by migrations or at runtime instead of by the models:
+# the partitions of messages, created by the partition manager, and the JSON public flags view.
+UNMANAGED_TABLES = re.compile(r"messages_legacy|messages_y\d{4}m\d{2}|users_with_json_flags")
+
+
+def include_name(name: str | None, type_: str, _parent_names: dict[str, str | None]) -> bool:
+    """Exclude the unmanaged tables from autogenerate, so migrations aren't generated to drop them."""
+    if type_ == "table":
+        return not UNMANAGED_TABLES.fullmatch(name)
+    return True
+
 
 def do_run_migrations(connection: Connection) -> None:
     """Run migrations."""
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -72,6 +84,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
     )
 
     with context.begin_transaction():
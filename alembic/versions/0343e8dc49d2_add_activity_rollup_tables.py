@@ -0,0 +1,55 @@
+"""
+Add activity rollup tables.
+
+The tables are maintained as messages are written, existing messages can be rolled up with rebuild_rollups.py.
+
+Revision ID: 0343e8dc49d2
+Revises: 3397ca059695
+Create Date: 2026-10-18 15:20:36.481562
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0343e8dc49d2"
+down_revision = "3397ca059695"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    op.create_table(
+        "channel_activity_hourly",
+        sa.Column("hour", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("channel_id", sa.BigInteger(), nullable=False),
+        sa.Column("thread_id", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("message_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("deleted_count", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("hour", "channel_id", "thread_id"),
+    )
+    op.create_index(
+        op.f("ix_channel_activity_hourly_channel_id"),
+        "channel_activity_hourly",
+        ["channel_id", "hour"],
+        unique=False,
+    )
+    op.create_table(
+        "user_activity_daily",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("message_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("deleted_count", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("day", "user_id"),
+    )
+    op.create_index(op.f("ix_user_activity_daily_user_id"), "user_activity_daily", ["user_id", "day"], unique=False)
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    op.drop_index(op.f("ix_user_activity_daily_user_id"), table_name="user_activity_daily")
+    op.drop_table("user_activity_daily")
+    op.drop_index(op.f("ix_channel_activity_hourly_channel_id"), table_name="channel_activity_hourly")
+    op.drop_table("channel_activity_hourly")
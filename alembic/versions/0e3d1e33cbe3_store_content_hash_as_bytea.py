@@ -0,0 +1,86 @@
+"""
+Store content_hash as bytea.
+
+The hex encoded MD5 digests are converted to their raw 16 bytes through a shadow column, which is kept in sync with
+writes from the running bot by a trigger while existing rows are backfilled in batches outside of a transaction.
+A hash index for duplicate content lookups is built concurrently before the columns are swapped.
+
+Revision ID: 0e3d1e33cbe3
+Revises: bb56ac21be54
+Create Date: 2026-10-18 13:40:29.318057
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0e3d1e33cbe3"
+down_revision = "bb56ac21be54"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 50_000
+
+
+def _backfill(expression: str) -> None:
+    """Set content_hash_new to the given expression for every message, in batches of `BACKFILL_BATCH_SIZE`."""
+    conn = op.get_bind()
+    last_id = 0
+
+    while True:
+        upper_id = conn.scalar(
+            sa.text(
+                "SELECT max(id) FROM (SELECT id FROM messages WHERE id > :last_id ORDER BY id LIMIT :size) AS batch",
+            ),
+            {"last_id": last_id, "size": BACKFILL_BATCH_SIZE},
+        )
+        if upper_id is None:
+            return
+
+        conn.execute(
+            sa.text(f"UPDATE messages SET content_hash_new = {expression} WHERE id > :last_id AND id <= :upper_id"),  # noqa: S608
+            {"last_id": last_id, "upper_id": upper_id},
+        )
+        last_id = upper_id
+
+
+def _convert(new_type: sa.types.TypeEngine, expression: str, *, index: bool) -> None:
+    """
+    Replace content_hash with a column of the new type holding the given expression of the current value.
+
+    If `index` is true a hash index is built on the new column.
+    """
+    op.add_column("messages", sa.Column("content_hash_new", new_type, nullable=True))
+    op.execute(
+        "CREATE FUNCTION messages_sync_content_hash() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+        f"BEGIN\n    NEW.content_hash_new := {expression};\n    RETURN NEW;\nEND\n$$",
+    )
+    op.execute(
+        "CREATE TRIGGER messages_sync_content_hash BEFORE INSERT OR UPDATE OF content_hash ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION messages_sync_content_hash()",
+    )
+
+    with op.get_context().autocommit_block():
+        _backfill(expression)
+        if index:
+            op.execute(
+                "CREATE INDEX CONCURRENTLY ix_messages_content_hash_new ON messages USING hash (content_hash_new)",
+            )
+
+    op.execute("DROP TRIGGER messages_sync_content_hash ON messages")
+    op.execute("DROP FUNCTION messages_sync_content_hash()")
+    op.drop_column("messages", "content_hash")
+    op.alter_column("messages", "content_hash_new", new_column_name="content_hash")
+    if index:
+        op.execute("ALTER INDEX ix_messages_content_hash_new RENAME TO ix_messages_content_hash")
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    _convert(sa.LargeBinary(), "decode(content_hash, 'hex')", index=True)
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    _convert(sa.String(), "encode(content_hash, 'hex')", index=False)
@@ -0,0 +1,75 @@
+"""
+Add indexes for time windowed analytics queries.
+
+Indexes can't be built concurrently on a partitioned table, so each index is created on the messages table alone,
+which is instant and leaves it invalid, then built concurrently on every partition and attached. The index becomes
+valid once it is attached to every partition, and partitions created later build it when they are created.
+
+The composite channel and author indexes replace the single column indexes on those columns.
+
+Revision ID: 14654559fc68
+Revises: 0343e8dc49d2
+Create Date: 2026-10-18 16:05:12.940218
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "14654559fc68"
+down_revision = "0343e8dc49d2"
+branch_labels = None
+depends_on = None
+
+MESSAGE_INDEXES = {
+    "ix_messages_channel_id_created_at": "btree (channel_id, created_at)",
+    "ix_messages_author_id_created_at": "btree (author_id, created_at)",
+    "ix_messages_created_at_brin": "brin (created_at)",
+    "ix_messages_not_deleted_created_at": "btree (created_at) WHERE NOT is_deleted",
+}
+REPLACED_MESSAGE_INDEXES = {
+    "ix_messages_channel_id": "btree (channel_id)",
+    "ix_messages_author_id": "btree (author_id)",
+}
+
+
+def _message_partitions() -> list[str]:
+    """Return the names of the partitions of the messages table."""
+    return op.get_bind().scalars(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'messages'::regclass",
+    )).all()
+
+
+def _create_message_index(name: str, definition: str) -> None:
+    """Create an index on the messages table by building it concurrently on each partition."""
+    op.execute(f"CREATE INDEX {name} ON ONLY messages USING {definition}")
+
+    for partition in _message_partitions():
+        partition_index = name.replace("messages", partition, 1)
+        op.execute(f"CREATE INDEX CONCURRENTLY {partition_index} ON {partition} USING {definition}")
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    with op.get_context().autocommit_block():
+        for name, definition in MESSAGE_INDEXES.items():
+            _create_message_index(name, definition)
+
+        op.execute("CREATE INDEX CONCURRENTLY ix_users_in_guild_joined_at ON users (joined_at) WHERE in_guild")
+
+    for name in REPLACED_MESSAGE_INDEXES:
+        op.drop_index(name, table_name="messages")
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    with op.get_context().autocommit_block():
+        for name, definition in REPLACED_MESSAGE_INDEXES.items():
+            _create_message_index(name, definition)
+
+        op.execute("DROP INDEX CONCURRENTLY ix_users_in_guild_joined_at")
+
+    for name in MESSAGE_INDEXES:
+        op.drop_index(name, table_name="messages")
@@ -0,0 +1,111 @@
+"""
+Add bigint shadow columns for all snowflake keys.
+
+This is the first half of moving the snowflake keys from varchar to bigint. Each key column gets a bigint shadow
+column which is kept in sync with the varchar column by a trigger, so the bot can keep writing while existing rows
+are backfilled in batches. The unique and foreign key indexes are then built concurrently on the shadow columns,
+ready for the columns to be swapped in by the next migration.
+
+Revision ID: 1893710edcc0
+Revises: 21fcc36cc482
+Create Date: 2026-10-18 12:26:08.114470
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "1893710edcc0"
+down_revision = "21fcc36cc482"
+branch_labels = None
+depends_on = None
+
+# The snowflake key columns of each table, and whether they are nullable.
+KEY_COLUMNS = {
+    "categories": {"id": False},
+    "channels": {"id": False, "category_id": True},
+    "threads": {"id": False, "parent_channel_id": False},
+    "users": {"id": False},
+    "messages": {"id": False, "channel_id": False, "thread_id": True, "author_id": False},
+}
+# Foreign key columns which are indexed.
+INDEXED_COLUMNS = (
+    ("messages", "channel_id"),
+    ("messages", "thread_id"),
+    ("messages", "author_id"),
+)
+BACKFILL_BATCH_SIZE = 50_000
+
+
+def _backfill(table: str, columns: dict[str, bool]) -> None:
+    """Fill the shadow columns of existing rows, walking the primary key in batches of `BACKFILL_BATCH_SIZE`."""
+    conn = op.get_bind()
+    assignments = ", ".join(f"{col}_int = {col}::bigint" for col in columns)
+    last_id = ""
+
+    while True:
+        upper_id = conn.scalar(
+            sa.text(
+                f"SELECT max(id) FROM (SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :size) AS batch",  # noqa: S608
+            ),
+            {"last_id": last_id, "size": BACKFILL_BATCH_SIZE},
+        )
+        if upper_id is None:
+            return
+
+        conn.execute(
+            sa.text(f"UPDATE {table} SET {assignments} WHERE id > :last_id AND id <= :upper_id"),  # noqa: S608
+            {"last_id": last_id, "upper_id": upper_id},
+        )
+        last_id = upper_id
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    for table, columns in KEY_COLUMNS.items():
+        for col, nullable in columns.items():
+            op.add_column(table, sa.Column(f"{col}_int", sa.BigInteger(), nullable=True))
+            if not nullable:
+                # Lets the swap set NOT NULL on the shadow column without scanning the table.
+                op.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {table}_{col}_int_not_null "
+                    f"CHECK ({col}_int IS NOT NULL) NOT VALID",
+                )
+
+        assignments = "\n".join(f"    NEW.{col}_int := NEW.{col}::bigint;" for col in columns)
+        op.execute(
+            f"CREATE FUNCTION {table}_sync_bigint_keys() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+            f"BEGIN\n{assignments}\n    RETURN NEW;\nEND\n$$",
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_sync_bigint_keys BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_sync_bigint_keys()",
+        )
+
+    # Every new or updated row is now covered by the triggers, so the rest is done outside of a transaction to
+    # avoid holding locks on the tables while they are backfilled and indexed.
+    with op.get_context().autocommit_block():
+        for table, columns in KEY_COLUMNS.items():
+            _backfill(table, columns)
+
+            for col, nullable in columns.items():
+                if not nullable:
+                    op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{col}_int_not_null")
+
+            op.execute(f"CREATE UNIQUE INDEX CONCURRENTLY {table}_id_int_key ON {table} (id_int)")
+
+        for table, col in INDEXED_COLUMNS:
+            op.execute(f"CREATE INDEX CONCURRENTLY ix_{table}_{col}_int ON {table} ({col}_int)")
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    # The shadow columns no longer exist if the swap to bigint keys has been reverted, as that converts the
+    # swapped in columns back to varchar in place.
+    for table, columns in KEY_COLUMNS.items():
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_bigint_keys ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS {table}_sync_bigint_keys()")
+
+        for col in columns:
+            op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {col}_int")
@@ -0,0 +1,83 @@
+"""
+Store public_flags as an integer.
+
+Revision ID: 21fcc36cc482
+Revises: 762526c132e9
+Create Date: 2026-10-18 11:41:52.907316
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "21fcc36cc482"
+down_revision = "762526c132e9"
+branch_labels = None
+depends_on = None
+
+# The public flags stored by discord.py, as of this migration, and their bit values.
+PUBLIC_FLAGS = {
+    "staff": 1 << 0,
+    "partner": 1 << 1,
+    "hypesquad": 1 << 2,
+    "bug_hunter": 1 << 3,
+    "hypesquad_bravery": 1 << 6,
+    "hypesquad_brilliance": 1 << 7,
+    "hypesquad_balance": 1 << 8,
+    "early_supporter": 1 << 9,
+    "team_user": 1 << 10,
+    "system": 1 << 12,
+    "bug_hunter_level_2": 1 << 14,
+    "verified_bot": 1 << 16,
+    "verified_bot_developer": 1 << 17,
+    # An alias of verified_bot_developer, which older versions of discord.py included in the stored flags.
+    "early_verified_bot_developer": 1 << 17,
+    "discord_certified_moderator": 1 << 18,
+    "bot_http_interactions": 1 << 19,
+    "spammer": 1 << 20,
+    "active_developer": 1 << 22,
+}
+
+USERS_VIEW_COLUMNS = (
+    "id",
+    "name",
+    "avatar_hash",
+    "guild_avatar_hash",
+    "joined_at",
+    "created_at",
+    "is_staff",
+    "bot",
+    "in_guild",
+    "pending",
+)
+
+
+def _flags_as_json() -> str:
+    """Return an expression building the JSON object of flags from the integer public_flags column."""
+    flags = ", ".join(f"'{name}', (public_flags & {value}) <> 0" for name, value in PUBLIC_FLAGS.items())
+    return f"json_build_object({flags})"
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    flags_as_int = " | ".join(
+        f"CASE WHEN public_flags->>'{name}' = 'true' THEN {value}::bigint ELSE 0 END"
+        for name, value in PUBLIC_FLAGS.items()
+    )
+    op.alter_column("users", "public_flags", type_=sa.BigInteger(), postgresql_using=flags_as_int)
+    op.alter_column("users", "public_flags", server_default="0", nullable=False)
+
+    # Existing consumers which expect the flags as a JSON object can read them from this view.
+    op.execute(
+        f"CREATE VIEW users_with_json_flags AS SELECT {', '.join(USERS_VIEW_COLUMNS)}, "  # noqa: S608
+        f"{_flags_as_json()} AS public_flags FROM users",
+    )
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    op.execute("DROP VIEW users_with_json_flags")
+
+    op.alter_column("users", "public_flags", server_default=None, nullable=True)
+    op.alter_column("users", "public_flags", type_=sa.JSON(), postgresql_using=_flags_as_json())
@@ -0,0 +1,117 @@
+"""
+Partition messages by month.
+
+The existing messages table becomes the first partition of a new messages table partitioned by range on created_at,
+holding everything before the start of next month, and monthly partitions are created from then on. The constraint
+and index the partition needs are built before the table is locked, so the swap itself doesn't scan the table.
+
+Revision ID: 3397ca059695
+Revises: 0e3d1e33cbe3
+Create Date: 2026-10-18 14:32:51.773409
+
+"""
+from datetime import UTC, datetime
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3397ca059695"
+down_revision = "0e3d1e33cbe3"
+branch_labels = None
+depends_on = None
+
+# The number of monthly partitions to create after the existing messages.
+PREMADE_PARTITIONS = 3
+MESSAGE_COLUMNS = ("id", "channel_id", "thread_id", "author_id", "created_at", "is_deleted", "content_hash")
+MESSAGE_INDEXES = {
+    "ix_messages_channel_id": "btree (channel_id)",
+    "ix_messages_thread_id": "btree (thread_id)",
+    "ix_messages_author_id": "btree (author_id)",
+    "ix_messages_content_hash": "hash (content_hash)",
+}
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    """Return the start of the month the given number of months after the given month."""
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=month_index + 1)
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    this_month = datetime.now(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    cutover = _add_months(this_month, 1)
+
+    # Prove the legacy partition's bounds and build its new primary key index without blocking writes.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "ALTER TABLE messages ADD CONSTRAINT messages_legacy_bound "
+            f"CHECK (created_at IS NOT NULL AND created_at < '{cutover.isoformat()}') NOT VALID",
+        )
+        op.execute("ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_bound")
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY messages_legacy_pkey_new ON messages (id, created_at)")
+
+    # The primary key of a partitioned table has to include the partition key.
+    op.alter_column("messages", "created_at", nullable=False)
+    op.drop_constraint("messages_pkey", "messages", type_="primary")
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_legacy_pkey PRIMARY KEY USING INDEX messages_legacy_pkey_new",
+    )
+
+    op.rename_table("messages", "messages_legacy")
+    for index in MESSAGE_INDEXES:
+        op.execute(f"ALTER INDEX {index} RENAME TO {index.replace('messages', 'messages_legacy', 1)}")
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("channel_id", sa.BigInteger(), nullable=False),
+        sa.Column("thread_id", sa.BigInteger(), nullable=True),
+        sa.Column("author_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("is_deleted", sa.Boolean(), nullable=False),
+        sa.Column("content_hash", sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(["channel_id"], ["channels.id"], name="messages_channel_id_fkey", ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["thread_id"], ["threads.id"], name="messages_thread_id_fkey", ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"], name="messages_author_id_fkey", ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id", "created_at", name="messages_pkey"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    for index, definition in MESSAGE_INDEXES.items():
+        op.execute(f"CREATE INDEX {index} ON messages USING {definition}")
+
+    # The matching indexes, primary key and foreign keys of the legacy table are attached rather than rebuilt,
+    # and the validated bound constraint means the table isn't scanned.
+    op.execute(
+        "ALTER TABLE messages ATTACH PARTITION messages_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{cutover.isoformat()}')",
+    )
+    op.drop_constraint("messages_legacy_bound", "messages_legacy", type_="check")
+
+    for months in range(PREMADE_PARTITIONS):
+        start = _add_months(cutover, months)
+        end = _add_months(start, 1)
+        op.execute(
+            f"CREATE TABLE messages_y{start.year}m{start.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')",
+        )
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    # This copies every message written since the upgrade into the legacy table, so should only be done with the
+    # bot stopped.
+    op.execute("ALTER TABLE messages DETACH PARTITION messages_legacy")
+    columns = ", ".join(MESSAGE_COLUMNS)
+    op.execute(f"INSERT INTO messages_legacy ({columns}) SELECT {columns} FROM messages")  # noqa: S608
+    op.drop_table("messages")
+
+    op.rename_table("messages_legacy", "messages")
+    for index in MESSAGE_INDEXES:
+        op.execute(f"ALTER INDEX {index.replace('messages', 'messages_legacy', 1)} RENAME TO {index}")
+
+    op.drop_constraint("messages_legacy_pkey", "messages", type_="primary")
+    op.create_primary_key("messages_pkey", "messages", ["id"])
+    op.alter_column("messages", "created_at", nullable=True)
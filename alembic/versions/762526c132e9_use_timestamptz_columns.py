@@ -0,0 +1,44 @@
+"""
+Use timestamptz for all timestamp columns.
+
+Revision ID: 762526c132e9
+Revises: 9f81ddfb87a7
+Create Date: 2026-10-18 11:03:17.562093
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "762526c132e9"
+down_revision = "9f81ddfb87a7"
+branch_labels = None
+depends_on = None
+
+TIMESTAMP_COLUMNS = (
+    ("messages", "created_at"),
+    ("threads", "created_at"),
+    ("users", "joined_at"),
+    ("users", "created_at"),
+)
+
+
+def _alter_timestamps(*, timezone: bool) -> None:
+    # The existing values are naive UTC timestamps. With the session time zone set to UTC, Postgres treats
+    # timestamp and timestamptz as binary compatible, so the columns are changed without rewriting the tables
+    # and the exclusive lock is only held for the catalog update, even on the messages table.
+    op.execute("SET LOCAL timezone = 'UTC'")
+
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, type_=sa.DateTime(timezone=timezone))
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    _alter_timestamps(timezone=True)
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    _alter_timestamps(timezone=False)
@@ -0,0 +1,35 @@
+"""
+Add backfill checkpoints.
+
+Revision ID: 88b439e9e71c
+Revises: 14654559fc68
+Create Date: 2026-10-18 16:47:55.208166
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "88b439e9e71c"
+down_revision = "14654559fc68"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    op.create_table(
+        "backfill_checkpoints",
+        sa.Column("channel_id", sa.BigInteger(), nullable=False),
+        sa.Column("oldest_message_id", sa.BigInteger(), nullable=True),
+        sa.Column("completed", sa.Boolean(), server_default="false", nullable=False),
+        sa.Column("messages_written", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("channel_id"),
+    )
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    op.drop_table("backfill_checkpoints")
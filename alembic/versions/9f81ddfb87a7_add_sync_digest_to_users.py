@@ -0,0 +1,27 @@
+"""
+Add sync_digest column to users.
+
+Revision ID: 9f81ddfb87a7
+Revises: a192a8d3282c
+Create Date: 2026-10-18 10:12:41.204815
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9f81ddfb87a7"
+down_revision = "a192a8d3282c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    op.add_column("users", sa.Column("sync_digest", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    op.drop_column("users", "sync_digest")
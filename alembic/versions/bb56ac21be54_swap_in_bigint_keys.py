@@ -0,0 +1,116 @@
+"""
+Swap in the bigint snowflake key columns.
+
+The varchar key columns are dropped and replaced with their backfilled bigint shadow columns. The primary keys are
+attached to the unique indexes already built on the shadow columns, and the foreign keys are recreated without
+validation and then validated outside of the transaction, so no table is rewritten or scanned under an exclusive
+lock.
+
+Revision ID: bb56ac21be54
+Revises: 1893710edcc0
+Create Date: 2026-10-18 12:58:44.630918
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "bb56ac21be54"
+down_revision = "1893710edcc0"
+branch_labels = None
+depends_on = None
+
+# The snowflake key columns of each table, and whether they are nullable, in the order they can be created.
+KEY_COLUMNS = {
+    "categories": {"id": False},
+    "channels": {"id": False, "category_id": True},
+    "threads": {"id": False, "parent_channel_id": False},
+    "users": {"id": False},
+    "messages": {"id": False, "channel_id": False, "thread_id": True, "author_id": False},
+}
+# Foreign key columns, the table they reference and whether they are indexed.
+FOREIGN_KEYS = (
+    ("channels", "category_id", "categories", False),
+    ("threads", "parent_channel_id", "channels", False),
+    ("messages", "channel_id", "channels", True),
+    ("messages", "thread_id", "threads", True),
+    ("messages", "author_id", "users", True),
+)
+# Views which depend on the key columns, and so need recreating when they are replaced.
+DEPENDENT_VIEWS = ("users_with_json_flags",)
+
+
+def _drop_dependent_views() -> dict[str, str]:
+    """Drop the views which depend on the key columns, returning their definitions."""
+    conn = op.get_bind()
+    definitions = {
+        view: conn.scalar(sa.text("SELECT pg_get_viewdef(CAST(:view AS regclass))"), {"view": view})
+        for view in DEPENDENT_VIEWS
+    }
+
+    for view in DEPENDENT_VIEWS:
+        op.execute(f"DROP VIEW {view}")
+
+    return definitions
+
+
+def _create_views(definitions: dict[str, str]) -> None:
+    """Recreate the given views."""
+    for view, definition in definitions.items():
+        op.execute(f"CREATE VIEW {view} AS {definition}")
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    views = _drop_dependent_views()
+
+    for table, columns in reversed(KEY_COLUMNS.items()):
+        op.execute(f"DROP TRIGGER {table}_sync_bigint_keys ON {table}")
+        op.execute(f"DROP FUNCTION {table}_sync_bigint_keys()")
+
+        # Dropping the varchar columns also drops their primary key, foreign keys and indexes.
+        for col in columns:
+            op.drop_column(table, col)
+
+    for table, columns in KEY_COLUMNS.items():
+        for col, nullable in columns.items():
+            op.alter_column(table, f"{col}_int", new_column_name=col)
+            if not nullable:
+                # The validated check constraint means this doesn't need to scan the table.
+                op.alter_column(table, col, nullable=False)
+                op.drop_constraint(f"{table}_{col}_int_not_null", table, type_="check")
+
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_id_int_key")
+
+    for table, col, referred_table, indexed in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{col}_fkey FOREIGN KEY ({col}) "
+            f"REFERENCES {referred_table} (id) ON DELETE CASCADE NOT VALID",
+        )
+        if indexed:
+            op.execute(f"ALTER INDEX ix_{table}_{col}_int RENAME TO ix_{table}_{col}")
+
+    _create_views(views)
+
+    with op.get_context().autocommit_block():
+        for table, col, _, _ in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{col}_fkey")
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    # This rewrites every table, so should only be done with the bot stopped.
+    views = _drop_dependent_views()
+
+    for table, col, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(f"{table}_{col}_fkey", table, type_="foreignkey")
+
+    for table, columns in KEY_COLUMNS.items():
+        for col in columns:
+            op.alter_column(table, col, type_=sa.String(), postgresql_using=f"{col}::varchar")
+
+    for table, col, referred_table, _ in FOREIGN_KEYS:
+        op.create_foreign_key(f"{table}_{col}_fkey", table, referred_table, [col], ["id"], ondelete="CASCADE")
+
+    _create_views(views)
@@ -0,0 +1,32 @@
+"""
+Add channel high water marks.
+
+Revision ID: e3f23eb24818
+Revises: 88b439e9e71c
+Create Date: 2026-10-18 17:31:04.667290
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e3f23eb24818"
+down_revision = "88b439e9e71c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Apply the current migration."""
+    op.create_table(
+        "channel_high_water_marks",
+        sa.Column("channel_id", sa.BigInteger(), nullable=False),
+        sa.Column("last_message_id", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("channel_id"),
+    )
+
+
+def downgrade() -> None:
+    """Revert the current migration."""
+    op.drop_table("channel_high_water_marks")
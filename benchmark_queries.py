@@ -0,0 +1,207 @@
+"""
+Benchmark the reporting queries against a synthetic dataset, before and after the analytics indexes migration.
+
+A scratch database is created next to the configured one, migrated to the revision before the indexes were added
+and seeded with synthetic messages. Each query in the catalogue is then timed with EXPLAIN ANALYZE, the indexes
+migration is applied and the queries are timed again.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from create_metricity_db import parse_db_url
+from metricity.database import build_db_uri
+
+BEFORE_REVISION = "0343e8dc49d2"
+AFTER_REVISION = "14654559fc68"
+
+SEED_STATEMENTS = (
+    """
+    INSERT INTO categories (id, name, deleted)
+    SELECT g, 'category ' || g, false FROM generate_series(1, 10) AS g
+    """,
+    """
+    INSERT INTO channels (id, name, category_id, is_staff, deleted)
+    SELECT 1000 + g, 'channel ' || g, 1 + g % 10, g % 10 = 0, false FROM generate_series(1, $1::int) AS g
+    """,
+    """
+    INSERT INTO users (id, name, joined_at, created_at, is_staff, bot, in_guild, public_flags, pending)
+    SELECT
+        100000 + g, 'user ' || g,
+        now() - random() * interval '1500 days', now() - interval '1500 days' - random() * interval '1500 days',
+        g % 100 = 0, false, random() < 0.7, 0, false
+    FROM generate_series(1, $1::int) AS g
+    """,
+    # Messages are generated in creation order, as they are inserted by the bot. Channels and authors are skewed
+    # so that a few of each are much more active than the rest, as in a real server.
+    """
+    INSERT INTO messages (id, channel_id, thread_id, author_id, created_at, is_deleted, content_hash)
+    SELECT
+        g,
+        1001 + floor($2::int * power(random(), 3))::int,
+        NULL,
+        100001 + floor($3::int * power(random(), 4))::int,
+        now() - $4::int * interval '1 day' * (1 - g::float / $1::int),
+        random() < 0.05,
+        decode(md5(g::text), 'hex')
+    FROM generate_series(1, $1::int) AS g
+    """,
+)
+
+# The reporting queries to time, each answering a question the dashboards ask.
+QUERIES = {
+    "messages per channel, last 30 days": """
+        SELECT channel_id, count(*) FROM messages
+        WHERE created_at >= now() - interval '30 days' AND NOT is_deleted
+        GROUP BY channel_id
+    """,
+    "messages per hour in one channel, last 7 days": """
+        SELECT date_trunc('hour', created_at), count(*) FROM messages
+        WHERE channel_id = 1001 AND created_at >= now() - interval '7 days'
+        GROUP BY 1
+    """,
+    "messages per day by one author, last 90 days": """
+        SELECT date_trunc('day', created_at), count(*) FROM messages
+        WHERE author_id = 100001 AND created_at >= now() - interval '90 days'
+        GROUP BY 1
+    """,
+    "most active authors, last 24 hours": """
+        SELECT author_id, count(*) FROM messages
+        WHERE created_at >= now() - interval '1 day' AND NOT is_deleted
+        GROUP BY author_id ORDER BY count(*) DESC LIMIT 10
+    """,
+    "staff vs non-staff messages, last 30 days": """
+        SELECT users.is_staff, count(*) FROM messages
+        JOIN users ON users.id = messages.author_id
+        WHERE messages.created_at >= now() - interval '30 days'
+        GROUP BY users.is_staff
+    """,
+    "members joined per month": """
+        SELECT date_trunc('month', joined_at), count(*) FROM users
+        WHERE in_guild AND joined_at >= now() - interval '365 days'
+        GROUP BY 1
+    """,
+}
+
+
+def connection_args(database: str | None = None) -> dict[str, Any]:
+    """Return the asyncpg connection arguments for the configured server, optionally for another database."""
+    parts = parse_db_url(build_db_uri())
+    return {
+        "host": parts.hostname,
+        "port": parts.port,
+        "user": parts.username,
+        "password": parts.password,
+        "database": database or parts.path[1:],
+    }
+
+
+def database_uri(database: str) -> str:
+    """Return the configured database URI pointing at the given database."""
+    return urlsplit(build_db_uri())._replace(path=f"/{database}").geturl()
+
+
+async def migrate(database: str, revision: str) -> None:
+    """Upgrade the given database to the given revision."""
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "alembic", "upgrade", revision,
+        env={**os.environ, "DATABASE_URI": database_uri(database)},
+    )
+    if await proc.wait() != 0:
+        raise RuntimeError(f"Migrating the benchmark database to {revision} failed")
+
+
+async def seed(conn: asyncpg.Connection, args: argparse.Namespace) -> None:
+    """Fill the benchmark database with synthetic categories, channels, users and messages."""
+    categories, channels, users, messages = SEED_STATEMENTS
+
+    await conn.execute(categories)
+    await conn.execute(channels, args.channels)
+    await conn.execute(users, args.users)
+    await conn.execute(messages, args.messages, args.channels, args.users, args.days)
+
+
+async def time_queries(conn: asyncpg.Connection, repeats: int) -> dict[str, float]:
+    """Return the median execution time in milliseconds of each query in the catalogue."""
+    await conn.execute("VACUUM ANALYZE")
+
+    timings = {}
+    for name, query in QUERIES.items():
+        samples = []
+        for _ in range(repeats):
+            plan = json.loads(await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"))
+            samples.append(plan[0]["Planning Time"] + plan[0]["Execution Time"])
+        timings[name] = statistics.median(samples)
+
+    return timings
+
+
+async def benchmark(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """Create and seed the benchmark database, returning the query timings before and after the indexes."""
+    sys_conn = await asyncpg.connect(**connection_args("template1"))
+    await sys_conn.execute(f'DROP DATABASE IF EXISTS "{args.database}"')
+    await sys_conn.execute(f'CREATE DATABASE "{args.database}"')
+
+    try:
+        await migrate(args.database, BEFORE_REVISION)
+
+        conn = await asyncpg.connect(**connection_args(args.database))
+        try:
+            print(f"Seeding {args.messages} messages over {args.days} days.")  # noqa: T201
+            await seed(conn, args)
+
+            print("Timing queries before the indexes.")  # noqa: T201
+            before = await time_queries(conn, args.repeats)
+
+            await migrate(args.database, AFTER_REVISION)
+
+            print("Timing queries after the indexes.")  # noqa: T201
+            after = await time_queries(conn, args.repeats)
+        finally:
+            await conn.close()
+    finally:
+        if not args.keep:
+            await sys_conn.execute(f'DROP DATABASE IF EXISTS "{args.database}"')
+        await sys_conn.close()
+
+    return {name: {"before": before[name], "after": after[name]} for name in QUERIES}
+
+
+def main() -> None:
+    """Run the benchmark and report the results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="metricity_benchmark", help="The scratch database to create.")
+    parser.add_argument("--messages", type=int, default=5_000_000, help="The number of messages to generate.")
+    parser.add_argument("--channels", type=int, default=200, help="The number of channels to generate.")
+    parser.add_argument("--users", type=int, default=100_000, help="The number of users to generate.")
+    parser.add_argument("--days", type=int, default=730, help="The number of days the messages are spread over.")
+    parser.add_argument("--repeats", type=int, default=5, help="How many times to run each query.")
+    parser.add_argument("--output", type=Path, help="Write the timings to this file as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database afterwards.")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+
+    width = max(len(name) for name in results)
+    print(f"\n{'query':<{width}}  {'before':>11}  {'after':>11}  speedup")  # noqa: T201
+    for name, timings in results.items():
+        speedup = timings["before"] / timings["after"] if timings["after"] else float("inf")
+        print(  # noqa: T201
+            f"{name:<{width}}  {timings['before']:>8.2f} ms  {timings['after']:>8.2f} ms  {speedup:>6.1f}x",
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
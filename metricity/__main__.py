@@ -8,7 +8,7 @@ from discord.ext import commands
 
 import metricity
 from metricity.bot import Bot
-from metricity.config import BotConfig
+from metricity.config import BotConfig, SyncConfig
 
 
 async def main() -> None:
@@ -37,6 +37,11 @@ async def main() -> None:
             activity=discord.Game(f"Metricity {metricity.__version__}"),
             intents=intents,
             max_messages=None,
+            # When streaming members the startup sync fetches them from the API instead of the member cache,
+            # so only members who join or are updated while the bot is running are cached. discord.py only
+            # dispatches member updates for cached members, so those members have to be cached in both modes.
+            chunk_guilds_at_startup=not SyncConfig.stream_members,
+            member_cache_flags=discord.MemberCacheFlags(voice=False, joined=True),
             allowed_mentions=None,
             allowed_roles=None,
             help_command=None,
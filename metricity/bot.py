@@ -6,6 +6,10 @@ from pydis_core import BotBase
 from pydis_core.utils import logging
 
 from metricity import exts
+from metricity.config import IngestConfig
+from metricity.exts.event_listeners._syncer_utils import ChannelSyncCoordinator
+from metricity.exts.event_listeners._user_cache import UserStateCache
+from metricity.exts.event_listeners._user_index import KnownUserIndex
 
 log = logging.get_logger(__name__)
 
@@ -17,7 +21,9 @@ class Bot(BotBase):
         super().__init__(*args, **kwargs)
 
         self.sync_process_complete = asyncio.Event()
-        self.channel_sync_in_progress = asyncio.Event()
+        self.channel_sync = ChannelSyncCoordinator(self)
+        self.known_users = KnownUserIndex()
+        self.user_states = UserStateCache(IngestConfig.user_cache_size)
 
     async def setup_hook(self) -> None:
         """Connect to db and load cogs."""
@@ -129,3 +129,68 @@ class DatabaseConfig(metaclass=ConfigSection):
     password: str | None
 
     log_queries: bool | None
+
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int
+    pool_pre_ping: bool
+    prepared_statement_cache_size: int
+    statement_cache_size: int
+
+    replica_uri: str | None
+    replica_max_lag: float
+    replica_check_interval: float
+
+
+class IngestConfig(metaclass=ConfigSection):
+    """Configuration for how Metricity buffers and writes incoming events."""
+
+    section = "ingest"
+
+    message_batch_size: int
+    message_flush_interval: float
+    max_parked_messages: int
+
+    member_batch_size: int
+    member_flush_interval: float
+    user_cache_size: int
+
+
+class SyncConfig(metaclass=ConfigSection):
+    """Configuration for how Metricity synchronises the guild with the database."""
+
+    section = "sync"
+
+    channel_sync_debounce: float
+    channel_reconcile_interval: int
+
+    user_sync_method: str
+    user_sync_concurrency: int
+    user_sync_retries: int
+    user_sync_digests: bool
+
+    stream_members: bool
+
+    catch_up_lookback: int
+    catch_up_concurrency: int
+
+
+class PartitionConfig(metaclass=ConfigSection):
+    """Configuration for managing the partitions of the messages table."""
+
+    section = "partitions"
+
+    premake_months: int
+    maintenance_interval: int
+
+
+class BackfillConfig(metaclass=ConfigSection):
+    """Configuration for backfilling the message history of the guild."""
+
+    section = "backfill"
+
+    concurrency: int
+    requests_per_second: float
+    include_archived_threads: bool
+    progress_interval: float
@@ -1,27 +1,37 @@
 """General utility functions and classes for Metricity."""
 
 import logging
-from datetime import UTC, datetime
+import math
+import time
+from bisect import bisect_left
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from urllib.parse import urlsplit
 
-from sqlalchemy.engine import Dialect
-from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
-from sqlalchemy.types import DateTime, TypeDecorator
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 
 from metricity.config import DatabaseConfig
 
 log = logging.getLogger(__name__)
 
 
+def _use_asyncpg(uri: str) -> str:
+    """Return the given database uri updated to use the asyncpg driver."""
+    parsed = urlsplit(uri)
+    if parsed.scheme != "postgresql+asyncpg":
+        log.debug("The given db_url did not use the asyncpg driver. Updating the db_url to use asyncpg.")
+        return parsed._replace(scheme="postgresql+asyncpg").geturl()
+
+    return uri
+
+
 def build_db_uri() -> str:
     """Build the database uri from the config."""
     if DatabaseConfig.uri:
-        parsed = urlsplit(DatabaseConfig.uri)
-        if parsed.scheme != "postgresql+asyncpg":
-            log.debug("The given db_url did not use the asyncpg driver. Updating the db_url to use asyncpg.")
-            return parsed._replace(scheme="postgresql+asyncpg").geturl()
-
-        return DatabaseConfig.uri
+        return _use_asyncpg(DatabaseConfig.uri)
 
     return (
         f"postgresql+asyncpg://{DatabaseConfig.username}:{DatabaseConfig.password}"
@@ -29,33 +39,142 @@ def build_db_uri() -> str:
     )
 
 
-engine: AsyncEngine = create_async_engine(build_db_uri(), echo=DatabaseConfig.log_queries)
+class PoolStatistics:
+    """Statistics about how long checking a connection out of the engine's pool takes."""
+
+    # Upper bounds, in seconds, of the buckets in the checkout wait time histogram.
+    WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, math.inf)
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.wait_histogram = [0] * len(self.WAIT_BUCKETS)
+
+    def observe(self, wait: float) -> None:
+        """Record a checkout that waited the given number of seconds."""
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.wait_histogram[bisect_left(self.WAIT_BUCKETS, wait)] += 1
+
+
+pool_stats = PoolStatistics()
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """The default async queue pool, recording checkout wait times in `pool_stats`."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.observe(time.perf_counter() - start)
+
+
+engine: AsyncEngine = create_async_engine(
+    build_db_uri(),
+    echo=DatabaseConfig.log_queries,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_size=DatabaseConfig.pool_size,
+    max_overflow=DatabaseConfig.max_overflow,
+    pool_timeout=DatabaseConfig.pool_timeout,
+    pool_recycle=DatabaseConfig.pool_recycle,
+    pool_pre_ping=DatabaseConfig.pool_pre_ping,
+    connect_args={
+        # SQLAlchemy's own cache of prepared statements, per connection.
+        "prepared_statement_cache_size": DatabaseConfig.prepared_statement_cache_size,
+        # asyncpg's cache of statements executed directly on the connection.
+        "statement_cache_size": DatabaseConfig.statement_cache_size,
+    },
+)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
+# An optional read replica for read-only queries, see `read_session`.
+read_engine: AsyncEngine | None = None
+async_read_session: async_sessionmaker | None = None
+if DatabaseConfig.replica_uri:
+    read_engine = create_async_engine(
+        _use_asyncpg(DatabaseConfig.replica_uri),
+        echo=DatabaseConfig.log_queries,
+        pool_pre_ping=True,
+    )
+    async_read_session = async_sessionmaker(read_engine, expire_on_commit=False)
 
-class TZDateTime(TypeDecorator):
-    """
-    A db type that supports the use of aware datetimes in user-land.
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaHealth:
+    """Caches whether the read replica is reachable and within the configured replication lag."""
 
-    Source from SQLAlchemy docs:
-    https://docs.sqlalchemy.org/en/14/core/custom_types.html#store-timezone-aware-timestamps-as-timezone-naive-utc
+    def __init__(self) -> None:
+        self.usable = False
+        self.lag: float | None = None
+        self.checked_at = -math.inf
 
-    Edited to include docstrings and type hints.
+    async def check(self) -> bool:
+        """Return whether the replica can be used, querying its replication lag at most every check interval."""
+        if read_engine is None:
+            return False
+
+        if time.monotonic() - self.checked_at < DatabaseConfig.replica_check_interval:
+            return self.usable
+
+        self.checked_at = time.monotonic()
+        try:
+            async with read_engine.connect() as conn:
+                self.lag = float(await conn.scalar(REPLICA_LAG_QUERY))
+        except (DBAPIError, OSError):
+            log.warning("Read replica is unavailable, falling back to the primary", exc_info=True)
+            self.lag = None
+            self.usable = False
+            return False
+
+        usable = self.lag <= DatabaseConfig.replica_max_lag
+        if usable != self.usable:
+            log.info("Read replica is %s, replication lag is %.1fs", "in use" if usable else "lagging", self.lag)
+        self.usable = usable
+        return usable
+
+
+replica_health = ReplicaHealth()
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
     """
+    Open a session for read-only queries.
 
-    impl = DateTime
-    cache_ok = True
-
-    def process_bind_param(self, value: datetime, _dialect: Dialect) -> datetime:
-        """Convert the value to aware before saving to db."""
-        if value is not None:
-            if not value.tzinfo:
-                raise TypeError("tzinfo is required")
-            value = value.astimezone(UTC).replace(tzinfo=None)
-        return value
-
-    def process_result_value(self, value: datetime, _dialect: Dialect) -> datetime:
-        """Convert the value to aware before passing back to user-land."""
-        if value is not None:
-            value = value.replace(tzinfo=UTC)
-        return value
+    The session is bound to the read replica if one is configured, reachable, and replicating within
+    `replica_max_lag` seconds of the primary, otherwise it is bound to the primary. Queries that must see
+    writes made moments ago should use `async_session` instead.
+    """
+    factory = async_read_session if await replica_health.check() else async_session
+    async with factory() as sess:
+        yield sess
+
+
+def pool_status() -> dict[str, int | float | list[int]]:
+    """Return the current state of the engine's connection pool alongside the checkout statistics."""
+    pool: TimedAsyncAdaptedQueuePool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "mean_wait": pool_stats.total_wait / pool_stats.checkouts if pool_stats.checkouts else 0.0,
+        "max_wait": pool_stats.max_wait,
+        "wait_histogram": list(pool_stats.wait_histogram),
+    }
@@ -0,0 +1,257 @@
+"""Backfill the message history of the guild's channels and threads."""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+import asyncpg
+import discord
+from discord.ext import commands
+from pydis_core.utils import logging, scheduling
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from metricity import models
+from metricity.bot import Bot
+from metricity.config import BackfillConfig, BotConfig
+from metricity.database import async_session
+from metricity.exts.event_listeners import _history, _syncer_utils
+
+log = logging.get_logger(__name__)
+
+# The maximum number of archived threads Discord returns for a single request.
+ARCHIVED_THREADS_PAGE_SIZE = 100
+
+
+class Backfill(commands.Cog):
+    """Walk the message history of every tracked channel and thread, writing the messages that weren't recorded."""
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.limiter = _history.RequestLimiter(BackfillConfig.requests_per_second)
+        self.task: asyncio.Task | None = None
+
+        self.started_at = 0.0
+        self.channels_total = 0
+        self.channels_done = 0
+        self.messages_written = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether a backfill is currently running."""
+        return self.task is not None and not self.task.done()
+
+    async def cog_unload(self) -> None:
+        """Stop any running backfill, it will resume from its checkpoints when started again."""
+        if self.running:
+            self.task.cancel()
+
+    def progress(self) -> str:
+        """Return a summary of the progress of the current or last backfill."""
+        elapsed = time.monotonic() - self.started_at
+        rate = self.messages_written / elapsed if elapsed else 0.0
+        return (
+            f"{self.channels_done}/{self.channels_total} channels done, "
+            f"{self.messages_written:,} messages written, {rate:.1f} rows/s"
+        )
+
+    async def report_progress(self) -> None:
+        """Log the progress of the backfill every `progress_interval` seconds."""
+        while True:
+            await asyncio.sleep(BackfillConfig.progress_interval)
+            log.info("Backfill progress: %s", self.progress())
+
+    async def run(self) -> None:
+        """Backfill every channel and thread that hasn't been completed, resuming from their checkpoints."""
+        await self.bot.sync_process_complete.wait()
+
+        guild = self.bot.get_guild(BotConfig.guild_id)
+        channels = await self.find_channels(guild)
+
+        async with async_session() as sess:
+            checkpoints = {
+                checkpoint.channel_id: checkpoint
+                for checkpoint in await sess.scalars(select(models.BackfillCheckpoint))
+            }
+
+        queue: asyncio.Queue[tuple[_history.HistoryChannel, int | None]] = asyncio.Queue()
+        for channel in channels:
+            checkpoint = checkpoints.get(channel.id)
+            if checkpoint is None:
+                queue.put_nowait((channel, None))
+            elif not checkpoint.completed:
+                queue.put_nowait((channel, checkpoint.oldest_message_id))
+
+        self.started_at = time.monotonic()
+        self.channels_total = queue.qsize()
+        self.channels_done = 0
+        self.messages_written = 0
+        log.info("Backfilling %d channels and threads", self.channels_total)
+
+        reporter = scheduling.create_task(self.report_progress(), name="backfill-progress")
+        try:
+            async with asyncio.TaskGroup() as workers:
+                for _ in range(BackfillConfig.concurrency):
+                    workers.create_task(self.worker(queue))
+        finally:
+            reporter.cancel()
+
+        log.info("Backfill complete: %s", self.progress())
+
+    async def find_channels(self, guild: discord.Guild) -> list[_history.HistoryChannel]:
+        """Return the channels and threads to backfill, syncing any archived threads that are found."""
+        channels = _history.history_channels(guild)
+
+        if not BackfillConfig.include_archived_threads:
+            return list(channels.values())
+
+        synced = []
+        for parent in (*guild.text_channels, *guild.forums):
+            if _syncer_utils.is_ignored(parent) or not parent.permissions_for(guild.me).read_message_history:
+                continue
+
+            async for thread in self.archived_threads(parent):
+                if thread.id in channels:
+                    continue
+
+                try:
+                    synced.extend(await _syncer_utils.sync_thread(thread))
+                except SQLAlchemyError:
+                    log.exception("Failed to sync archived thread %d, skipping it", thread.id)
+                else:
+                    channels[thread.id] = thread
+
+        if synced:
+            self.bot.dispatch("channels_synced", synced)
+
+        return list(channels.values())
+
+    async def archived_threads(
+        self,
+        parent: discord.TextChannel | discord.ForumChannel,
+    ) -> AsyncIterator[discord.Thread]:
+        """Yield the archived threads of a channel, fetching them a page at a time within the request limit."""
+        before = None
+        while True:
+            await self.limiter.acquire()
+            page = [
+                thread
+                async for thread in parent.archived_threads(limit=ARCHIVED_THREADS_PAGE_SIZE, before=before)
+            ]
+            for thread in page:
+                yield thread
+
+            if len(page) < ARCHIVED_THREADS_PAGE_SIZE:
+                return
+            before = page[-1].archive_timestamp
+
+    async def worker(self, queue: asyncio.Queue[tuple[_history.HistoryChannel, int | None]]) -> None:
+        """Backfill channels from the queue until it is empty."""
+        while not queue.empty():
+            channel, before = queue.get_nowait()
+
+            try:
+                await self.backfill_channel(channel, before)
+            except (discord.HTTPException, SQLAlchemyError, asyncpg.PostgresError):
+                log.exception("Failed to backfill channel %d, it will be resumed by the next backfill", channel.id)
+
+            self.channels_done += 1
+
+    async def backfill_channel(self, channel: _history.HistoryChannel, before: int | None) -> None:
+        """Walk back through the history of a channel from before the given message, checkpointing every page."""
+        while True:
+            await self.limiter.acquire()
+            page = [
+                message
+                async for message in channel.history(
+                    limit=_history.HISTORY_PAGE_SIZE,
+                    before=discord.Object(before) if before else None,
+                )
+            ]
+            if not page:
+                await self.save_checkpoint(channel.id, before, 0, completed=True)
+                return
+
+            rows = await _history.stored_rows(self.bot, page)
+            if rows:
+                await _syncer_utils.write_messages(rows)
+                self.messages_written += len(rows)
+
+            before = min(message.id for message in page)
+            completed = len(page) < _history.HISTORY_PAGE_SIZE
+            await self.save_checkpoint(channel.id, before, len(rows), completed=completed)
+
+            if completed:
+                return
+
+    async def save_checkpoint(
+        self,
+        channel_id: int,
+        oldest_message_id: int | None,
+        written: int,
+        *,
+        completed: bool,
+    ) -> None:
+        """Record how far back the given channel has been backfilled."""
+        qs = insert(models.BackfillCheckpoint).values(
+            channel_id=channel_id,
+            oldest_message_id=oldest_message_id,
+            completed=completed,
+            messages_written=written,
+        )
+        qs = qs.on_conflict_do_update(
+            index_elements=[models.BackfillCheckpoint.channel_id],
+            set_={
+                "oldest_message_id": qs.excluded.oldest_message_id,
+                "completed": qs.excluded.completed,
+                "messages_written": models.BackfillCheckpoint.messages_written + qs.excluded.messages_written,
+                "updated_at": func.now(),
+            },
+        )
+
+        async with async_session() as sess:
+            await sess.execute(qs)
+            await sess.commit()
+
+    @commands.group(invoke_without_command=True)
+    @commands.has_any_role(BotConfig.staff_role_id)
+    @commands.guild_only()
+    async def backfill(self, ctx: commands.Context) -> None:
+        """Respond with the progress of the current or last backfill."""
+        if ctx.guild.id != BotConfig.guild_id:
+            return
+
+        state = "Running" if self.running else "Not running"
+        await ctx.send(f"{state}. {self.progress()}.")
+
+    @backfill.command(name="start")
+    async def backfill_start(self, ctx: commands.Context) -> None:
+        """Start backfilling every channel and thread, resuming from their checkpoints."""
+        if ctx.guild.id != BotConfig.guild_id:
+            return
+
+        if self.running:
+            await ctx.send("A backfill is already running.")
+            return
+
+        self.task = scheduling.create_task(self.run(), name="backfill")
+        await ctx.send("Started backfilling.")
+
+    @backfill.command(name="stop")
+    async def backfill_stop(self, ctx: commands.Context) -> None:
+        """Stop the running backfill, it resumes from its checkpoints when started again."""
+        if ctx.guild.id != BotConfig.guild_id:
+            return
+
+        if not self.running:
+            await ctx.send("No backfill is running.")
+            return
+
+        self.task.cancel()
+        await ctx.send(f"Stopped backfilling. {self.progress()}.")
+
+
+async def setup(bot: Bot) -> None:
+    """Load the Backfill cog."""
+    await bot.add_cog(Backfill(bot))
@@ -0,0 +1,158 @@
+"""Utilities for buffering database writes and flushing them in batches."""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+import asyncpg
+import sqlalchemy.exc
+from pydis_core.utils import logging, scheduling
+
+log = logging.get_logger(__name__)
+
+# Errors which say nothing about the rows themselves, batches failing with these are kept and retried.
+TRANSIENT_ERRORS = (
+    OSError,
+    TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.TransactionRollbackError,
+    sqlalchemy.exc.OperationalError,
+    sqlalchemy.exc.InterfaceError,
+    sqlalchemy.exc.TimeoutError,
+)
+# The longest time to wait between retries of a failed batch.
+MAX_RETRY_DELAY = 60.0
+# While writes are failing, at most this many batches of rows are kept, the oldest rows are discarded beyond it.
+MAX_BACKLOG_BATCHES = 100
+
+KeyT = TypeVar("KeyT", bound=Hashable)
+RowT = TypeVar("RowT")
+
+
+class BatchWriter(Generic[KeyT, RowT]):
+    """
+    A write-behind buffer which flushes rows to the database in batches.
+
+    Rows are keyed so that a row buffered for a key which is already pending replaces the pending row.
+    The buffer is flushed when it reaches `max_size` rows or `interval` seconds after the first row was
+    buffered, whichever comes first. Only one flush runs at a time.
+
+    A batch that fails with one of the `TRANSIENT_ERRORS` is put back into the buffer and retried with an
+    exponential backoff, any other error discards the batch.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write: Callable[[list[RowT]], Awaitable[None]],
+        *,
+        max_size: int,
+        interval: float,
+    ) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.interval = interval
+
+        self._write = write
+        self._pending: dict[KeyT, RowT] = {}
+        self._in_flight: set[KeyT] = set()
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._failures = 0
+        self._discarded = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def get(self, key: KeyT) -> RowT | None:
+        """Return the pending row for the given key, if there is one."""
+        return self._pending.get(key)
+
+    def is_in_flight(self, key: KeyT) -> bool:
+        """Return whether the row for the given key is currently being written."""
+        return key in self._in_flight
+
+    def add(self, key: KeyT, row: RowT) -> None:
+        """Buffer a row to be written, scheduling a flush if required."""
+        self._pending[key] = row
+
+        if self._failures:
+            # A retry is already scheduled, bound the backlog until the writes succeed again.
+            if len(self._pending) > self.max_size * MAX_BACKLOG_BATCHES:
+                del self._pending[next(iter(self._pending))]
+                self._discarded += 1
+            return
+
+        if len(self._pending) >= self.max_size:
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = scheduling.create_task(self.flush(), name=f"{self.name}-flush")
+        elif self._timer is None:
+            self._timer = scheduling.create_task(self._flush_later(), name=f"{self.name}-flush-timer")
+
+    async def _flush_later(self, delay: float | None = None) -> None:
+        """Flush the buffer once the given delay, or the flush interval, has passed."""
+        await asyncio.sleep(self.interval if delay is None else delay)
+        self._timer = None
+        await self.flush()
+
+    def _retry(self, keys: list[KeyT], batch: list[RowT]) -> None:
+        """Put a failed batch back into the buffer, keeping newer rows for the same keys, and schedule a retry."""
+        for key, row in zip(keys, batch, strict=True):
+            self._pending.setdefault(key, row)
+
+        self._failures += 1
+        delay = min(self.interval * 2 ** self._failures, MAX_RETRY_DELAY)
+        log.warning(
+            "Failed to write batch of %d %s rows, retrying in %.1fs",
+            len(batch),
+            self.name,
+            delay,
+            exc_info=True,
+        )
+
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = scheduling.create_task(self._flush_later(delay), name=f"{self.name}-flush-retry")
+
+    async def flush(self) -> None:
+        """Write all pending rows in batches of at most `max_size` rows."""
+        async with self._lock:
+            while self._pending:
+                keys = list(self._pending)[:self.max_size]
+                batch = [self._pending.pop(key) for key in keys]
+                self._in_flight.update(keys)
+
+                try:
+                    await self._write(batch)
+                except TRANSIENT_ERRORS:
+                    self._retry(keys, batch)
+                    return
+                except Exception:
+                    log.exception("Failed to write batch of %d %s rows", len(batch), self.name)
+                else:
+                    if self._failures:
+                        log.info("Writing %s rows succeeded after %d failed attempts", self.name, self._failures)
+                    if self._discarded:
+                        log.error("Discarded %d %s rows while writes were failing", self._discarded, self.name)
+                    self._failures = 0
+                    self._discarded = 0
+                finally:
+                    self._in_flight.clear()
+
+    async def close(self) -> None:
+        """Cancel any scheduled flush and write everything that is still pending."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        await self.flush()
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            log.error("Discarding %d %s rows which could not be written", len(self._pending), self.name)
@@ -0,0 +1,167 @@
+"""
+Raw asyncpg statements for the hot, fixed-shape writes made by the event listeners.
+
+These skip the ORM's unit of work entirely. Every statement takes one array parameter per column, so a whole batch
+is a single statement of a fixed shape which asyncpg prepares once per connection and caches.
+"""
+
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+from typing import Any
+
+import asyncpg
+import discord
+
+from metricity.database import engine
+
+# Messages are inserted, rolled up into the activity tables and recorded in the high water marks in a single
+# statement. Only messages that were actually inserted are counted, so writing a message twice doesn't count it
+# twice. The rollup rows are always written in key order so that concurrent inserts and deletions can't deadlock.
+INSERT_MESSAGES = """
+    WITH inserted AS (
+        INSERT INTO messages (id, channel_id, thread_id, author_id, created_at, is_deleted, content_hash)
+        SELECT * FROM unnest(
+            $1::bigint[], $2::bigint[], $3::bigint[], $4::bigint[], $5::timestamptz[], $6::boolean[], $7::bytea[]
+        )
+        ON CONFLICT (id, created_at) DO NOTHING
+        RETURNING id, channel_id, thread_id, author_id, created_at, is_deleted
+    ), high_water_marks AS (
+        INSERT INTO channel_high_water_marks AS mark (channel_id, last_message_id)
+        SELECT coalesce(thread_id, channel_id), max(id)
+        FROM inserted
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (channel_id) DO UPDATE SET
+            last_message_id = greatest(mark.last_message_id, excluded.last_message_id)
+    ), channel_activity AS (
+        INSERT INTO channel_activity_hourly AS rollup (hour, channel_id, thread_id, message_count, deleted_count)
+        SELECT
+            date_trunc('hour', created_at, 'UTC'), channel_id, coalesce(thread_id, 0),
+            count(*), count(*) FILTER (WHERE is_deleted)
+        FROM inserted
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (hour, channel_id, thread_id) DO UPDATE SET
+            message_count = rollup.message_count + excluded.message_count,
+            deleted_count = rollup.deleted_count + excluded.deleted_count
+    )
+    INSERT INTO user_activity_daily AS rollup (day, user_id, message_count, deleted_count)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, author_id, count(*), count(*) FILTER (WHERE is_deleted)
+    FROM inserted
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        message_count = rollup.message_count + excluded.message_count,
+        deleted_count = rollup.deleted_count + excluded.deleted_count
+"""
+
+# The creation time bounds let Postgres skip the partitions that can't contain the messages. Only messages which
+# weren't already flagged are counted as deleted in the activity tables.
+MARK_MESSAGES_DELETED = """
+    WITH deleted AS (
+        UPDATE messages SET is_deleted = true
+        WHERE id = ANY($1::bigint[]) AND created_at BETWEEN $2::timestamptz AND $3::timestamptz AND NOT is_deleted
+        RETURNING channel_id, thread_id, author_id, created_at
+    ), channel_activity AS (
+        INSERT INTO channel_activity_hourly AS rollup (hour, channel_id, thread_id, deleted_count)
+        SELECT date_trunc('hour', created_at, 'UTC'), channel_id, coalesce(thread_id, 0), count(*)
+        FROM deleted
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (hour, channel_id, thread_id) DO UPDATE SET
+            deleted_count = rollup.deleted_count + excluded.deleted_count
+    )
+    INSERT INTO user_activity_daily AS rollup (day, user_id, deleted_count)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, author_id, count(*)
+    FROM deleted
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        deleted_count = rollup.deleted_count + excluded.deleted_count
+"""
+
+UPSERT_USERS = """
+    INSERT INTO users (
+        id, name, avatar_hash, guild_avatar_hash, joined_at, created_at,
+        is_staff, bot, in_guild, public_flags, pending, sync_digest
+    )
+    SELECT * FROM unnest(
+        $1::bigint[], $2::varchar[], $3::varchar[], $4::varchar[], $5::timestamptz[], $6::timestamptz[],
+        $7::boolean[], $8::boolean[], $9::boolean[], $10::bigint[], $11::boolean[], $12::bigint[]
+    )
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name,
+        avatar_hash = excluded.avatar_hash,
+        guild_avatar_hash = excluded.guild_avatar_hash,
+        joined_at = excluded.joined_at,
+        is_staff = excluded.is_staff,
+        bot = excluded.bot,
+        in_guild = excluded.in_guild,
+        public_flags = excluded.public_flags,
+        pending = excluded.pending,
+        sync_digest = excluded.sync_digest
+    WHERE users.sync_digest IS DISTINCT FROM excluded.sync_digest OR NOT users.in_guild
+"""
+
+MARK_USER_OFF_GUILD = """
+    UPDATE users SET in_guild = false, sync_digest = NULL WHERE id = $1
+"""
+
+MESSAGE_COLUMNS = ("id", "channel_id", "thread_id", "author_id", "created_at", "is_deleted", "content_hash")
+USER_COLUMNS = (
+    "id",
+    "name",
+    "avatar_hash",
+    "guild_avatar_hash",
+    "joined_at",
+    "created_at",
+    "is_staff",
+    "bot",
+    "in_guild",
+    "public_flags",
+    "pending",
+    "sync_digest",
+)
+
+
+@asynccontextmanager
+async def raw_connection() -> AsyncIterator[asyncpg.Connection]:
+    """Check a connection out of the engine's pool and yield the underlying asyncpg connection."""
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        yield raw_conn.driver_connection
+
+
+def _columns(rows: list[dict[str, Any]], columns: Iterable[str]) -> list[list[Any]]:
+    """Transpose the given rows into one list of values per column."""
+    return [[row[col] for row in rows] for col in columns]
+
+
+async def insert_messages(rows: list[dict[str, Any]]) -> None:
+    """Insert the given message rows and count them in the activity rollups, skipping messages already stored."""
+    async with raw_connection() as conn:
+        await conn.execute(INSERT_MESSAGES, *_columns(rows, MESSAGE_COLUMNS))
+
+
+async def mark_messages_deleted(message_ids: Iterable[int]) -> None:
+    """Set the is_deleted flag on the given messages and count them as deleted in the activity rollups."""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+
+    created_at = [discord.utils.snowflake_time(message_id) for message_id in message_ids]
+
+    async with raw_connection() as conn:
+        await conn.execute(MARK_MESSAGES_DELETED, message_ids, min(created_at), max(created_at))
+
+
+async def upsert_users(rows: list[dict[str, Any]]) -> None:
+    """Insert or update the given user rows, leaving rows whose stored state is unchanged untouched."""
+    async with raw_connection() as conn:
+        await conn.execute(UPSERT_USERS, *_columns(rows, USER_COLUMNS))
+
+
+async def mark_user_off_guild(user_id: int) -> None:
+    """Set in_guild to false for the given user, clearing their sync digest."""
+    async with raw_connection() as conn:
+        await conn.execute(MARK_USER_OFF_GUILD, user_id)
@@ -0,0 +1,69 @@
+"""Utilities for fetching the message history of channels and threads."""
+
+import asyncio
+import time
+from collections.abc import Iterable
+from typing import Any, TYPE_CHECKING
+
+import discord
+
+from metricity.exts.event_listeners import _syncer_utils
+
+if TYPE_CHECKING:
+    from metricity.bot import Bot
+
+# The maximum number of messages Discord returns for a single history request.
+HISTORY_PAGE_SIZE = 100
+
+HistoryChannel = discord.TextChannel | discord.VoiceChannel | discord.StageChannel | discord.Thread
+
+
+class RequestLimiter:
+    """
+    A token bucket shared by concurrent history fetches, limiting how often history requests are made.
+
+    discord.py already waits for the per-route rate limits, this keeps history fetches well clear of the global
+    rate limit so that requests made by the rest of the bot are not delayed.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request can be made."""
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1.0
+                self._updated = time.monotonic()
+
+            self._tokens -= 1
+
+
+def history_channels(guild: discord.Guild) -> dict[int, HistoryChannel]:
+    """Return the cached channels and threads whose messages are tracked and whose history can be read."""
+    return {
+        channel.id: channel
+        for channel in (*guild.channels, *guild.threads)
+        if isinstance(channel, HistoryChannel)
+        and not _syncer_utils.is_ignored(channel)
+        and channel.permissions_for(guild.me).read_message_history
+    }
+
+
+async def stored_rows(bot: "Bot", messages: Iterable[discord.Message]) -> list[dict[str, Any]]:
+    """Return the rows of the given messages which would have been stored had they been received live."""
+    return [
+        _syncer_utils.message_row(message)
+        for message in messages
+        if not message.author.bot
+        and message.type not in _syncer_utils.IGNORED_MESSAGE_TYPES
+        and await bot.known_users.contains(message.author.id)
+    ]
@@ -1,149 +1,321 @@
-import binascii
+import asyncio
 import hashlib
+from collections.abc import Callable
+from typing import Any, TYPE_CHECKING
 
 import discord
-from pydis_core.utils import logging
-from sqlalchemy import update
+from asyncpg import IntegrityConstraintViolationError
+from pydis_core.utils import logging, scheduling
+from sqlalchemy import ColumnElement, column, update
+from sqlalchemy.dialects.postgresql import Insert, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from metricity import models
-from metricity.bot import Bot
-from metricity.config import BotConfig
+from metricity.config import BotConfig, SyncConfig
 from metricity.database import async_session
+from metricity.exts.event_listeners import _fast_path
+
+if TYPE_CHECKING:
+    from metricity.bot import Bot
 
 log = logging.get_logger(__name__)
 
+# Message types which are generated by Discord rather than sent by a user.
+IGNORED_MESSAGE_TYPES = {discord.MessageType.thread_created, discord.MessageType.auto_moderation_action}
 
-def insert_thread(thread: discord.Thread, sess: AsyncSession) -> None:
-    """Insert the given thread to the database session."""
-    sess.add(models.Thread(
-        id=str(thread.id),
-        parent_channel_id=str(thread.parent_id),
-        name=thread.name,
-        archived=thread.archived,
-        auto_archive_duration=thread.auto_archive_duration,
-        locked=thread.locked,
-        type=thread.type.name,
-        created_at=thread.created_at,
-    ))
+# Each row binds up to 12 parameters, keep statements well below asyncpg's limit of 32767 parameters.
+UPSERT_CHUNK_SIZE = 1000
 
+# Columns overwritten when a category, channel or thread that already exists is synced.
+CATEGORY_UPDATE_COLUMNS = ("name", "deleted")
+CHANNEL_UPDATE_COLUMNS = ("name", "category_id", "is_staff", "deleted")
+THREAD_UPDATE_COLUMNS = ("name", "archived", "auto_archive_duration", "locked", "type")
+USER_UPDATE_COLUMNS = (
+    "name",
+    "avatar_hash",
+    "guild_avatar_hash",
+    "joined_at",
+    "is_staff",
+    "bot",
+    "in_guild",
+    "public_flags",
+    "pending",
+    "sync_digest",
+)
+USER_FINGERPRINT_VERSION = 2
 
-async def sync_message(message: discord.Message, sess: AsyncSession, *, from_thread: bool) -> None:
-    """Sync the given message with the database."""
-    if await sess.get(models.Message, str(message.id)):
-        return
 
+def category_row(category: discord.CategoryChannel) -> dict[str, Any]:
+    """Build the row to store in the categories table for the given category."""
+    return {
+        "id": category.id,
+        "name": category.name,
+        "deleted": False,
+    }
+
+
+def channel_row(channel: discord.abc.GuildChannel) -> dict[str, Any]:
+    """Build the row to store in the channels table for the given channel."""
+    return {
+        "id": channel.id,
+        "name": channel.name,
+        "category_id": channel.category.id if channel.category else None,
+        # Cast to bool so is_staff is False if channel.category is None
+        "is_staff": channel.id in BotConfig.staff_channels or bool(
+            channel.category and channel.category.id in BotConfig.staff_categories,
+        ),
+        "deleted": False,
+    }
+
+
+def thread_row(thread: discord.Thread) -> dict[str, Any]:
+    """Build the row to store in the threads table for the given thread."""
+    return {
+        "id": thread.id,
+        "parent_channel_id": thread.parent_id,
+        "name": thread.name,
+        "archived": thread.archived,
+        "auto_archive_duration": thread.auto_archive_duration,
+        "locked": thread.locked,
+        "type": thread.type.name,
+        "created_at": thread.created_at,
+    }
+
+
+def user_fingerprint(row: dict[str, Any]) -> int:
+    """
+    Return a 64-bit fingerprint of the member state stored in the given user row.
+
+    Bump `USER_FINGERPRINT_VERSION` whenever the fingerprinted fields change, so stored digests are ignored.
+    """
+    state = (
+        USER_FINGERPRINT_VERSION,
+        row["name"],
+        row["avatar_hash"],
+        row["guild_avatar_hash"],
+        row["joined_at"],
+        row["is_staff"],
+        row["bot"],
+        row["pending"],
+        row["public_flags"],
+    )
+    digest = hashlib.blake2b(repr(state).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, signed=True)
+
+
+def user_row(member: discord.Member) -> dict[str, Any]:
+    """Build the row to store in the users table for the given member."""
+    row = {
+        "id": member.id,
+        "name": member.name,
+        "avatar_hash": getattr(member.avatar, "key", None),
+        "guild_avatar_hash": getattr(member.guild_avatar, "key", None),
+        "joined_at": member.joined_at,
+        "created_at": member.created_at,
+        "is_staff": BotConfig.staff_role_id in [role.id for role in member.roles],
+        "bot": member.bot,
+        "in_guild": True,
+        "public_flags": member.public_flags.value,
+        "pending": member.pending,
+    }
+    row["sync_digest"] = user_fingerprint(row)
+    return row
+
+
+def is_ignored(channel: discord.abc.GuildChannel | discord.Thread) -> bool:
+    """Return whether the given channel or thread is in an ignored category."""
+    if isinstance(channel, discord.Thread):
+        channel = channel.parent
+        if channel is None:
+            return False
+
+    return bool(channel.category and channel.category.id in BotConfig.ignore_categories)
+
+
+async def upsert_rows(
+    model: type[models.Base],
+    rows: list[dict[str, Any]],
+    update_columns: tuple[str, ...],
+    sess: AsyncSession,
+    *,
+    where: Callable[[Insert], ColumnElement[bool]] | None = None,
+) -> tuple[int, int]:
+    """
+    Insert or update the given rows in chunks, returning the number of rows inserted and updated.
+
+    Whether each row was inserted or updated is determined from the returned xmax system column, which is
+    0 for freshly inserted rows. If `where` is given it is called with each insert statement to build the
+    condition an existing row must meet to be updated.
+    """
+    created = 0
+    updated = 0
+
+    for chunk in discord.utils.as_chunks(rows, UPSERT_CHUNK_SIZE):
+        qs = insert(model).returning(column("xmax")).values(chunk)
+        res = await sess.execute(qs.on_conflict_do_update(
+            index_elements=[model.id],
+            set_={k: getattr(qs.excluded, k) for k in update_columns},
+            where=where(qs) if where is not None else None,
+        ))
+
+        xmaxes = res.scalars().all()
+        inserted = xmaxes.count(0)
+        created += inserted
+        updated += len(xmaxes) - inserted
+
+    return created, updated
+
+
+async def _upsert_channel(channel: discord.abc.GuildChannel, sess: AsyncSession) -> list[int]:
+    """Insert or update the given channel, and its category, in the database session."""
+    synced = [channel.id]
+    if channel.category:
+        await upsert_rows(models.Category, [category_row(channel.category)], CATEGORY_UPDATE_COLUMNS, sess)
+        synced.append(channel.category.id)
+
+    await upsert_rows(models.Channel, [channel_row(channel)], CHANNEL_UPDATE_COLUMNS, sess)
+    return synced
+
+
+async def sync_channel(channel: discord.abc.GuildChannel) -> list[int]:
+    """Sync a single category or channel with the database, returning the IDs that were written."""
+    if is_ignored(channel):
+        return []
+
+    async with async_session() as sess:
+        if isinstance(channel, discord.CategoryChannel):
+            await upsert_rows(models.Category, [category_row(channel)], CATEGORY_UPDATE_COLUMNS, sess)
+            synced = [channel.id]
+        else:
+            synced = await _upsert_channel(channel, sess)
+        await sess.commit()
+
+    return synced
+
+
+async def sync_thread(thread: discord.Thread) -> list[int]:
+    """Sync a single thread, and its parent channel, with the database, returning the IDs that were written."""
+    if is_ignored(thread) or thread.parent is None:
+        return []
+
+    async with async_session() as sess:
+        synced = await _upsert_channel(thread.parent, sess)
+        await upsert_rows(models.Thread, [thread_row(thread)], THREAD_UPDATE_COLUMNS, sess)
+        await sess.commit()
+
+    return [*synced, thread.id]
+
+
+async def mark_channel_deleted(channel: discord.abc.GuildChannel) -> None:
+    """Set the deleted flag on a single category or channel."""
+    model = models.Category if isinstance(channel, discord.CategoryChannel) else models.Channel
+
+    async with async_session() as sess:
+        await sess.execute(update(model).where(model.id == channel.id).values(deleted=True))
+        await sess.commit()
+
+
+def message_row(message: discord.Message) -> dict[str, Any]:
+    """Build the row to insert into the messages table for the given message."""
     hash_ctx = hashlib.md5()  # noqa: S324
     hash_ctx.update(message.content.encode())
-    digest = hash_ctx.digest()
-    digest_encoded = binascii.hexlify(digest).decode()
 
-    args = {
-        "id": str(message.id),
-        "channel_id": str(message.channel.id),
-        "author_id": str(message.author.id),
+    row = {
+        "id": message.id,
+        "channel_id": message.channel.id,
+        "thread_id": None,
+        "author_id": message.author.id,
         "created_at": message.created_at,
-        "content_hash": digest_encoded,
+        "is_deleted": False,
+        "content_hash": hash_ctx.digest(),
     }
 
-    if from_thread:
+    if isinstance(message.channel, discord.Thread):
         thread = message.channel
-        args["channel_id"] = str(thread.parent_id)
-        args["thread_id"] = str(thread.id)
+        row["channel_id"] = thread.parent_id
+        row["thread_id"] = thread.id
 
-    sess.add(models.Message(**args))
+    return row
 
 
-async def sync_channels(bot: Bot, guild: discord.Guild) -> None:
-    """Sync channels and categories with the database."""
-    bot.channel_sync_in_progress.clear()
+async def write_messages(rows: list[dict[str, Any]]) -> None:
+    """
+    Insert a batch of message rows.
 
-    log.info("Beginning category synchronisation process")
+    If the batch violates a constraint (e.g. a message references a channel that has not been synced)
+    the messages are retried individually so that one bad row does not drop the whole batch.
+    """
+    try:
+        await _fast_path.insert_messages(rows)
+    except IntegrityConstraintViolationError:
+        log.warning("Batch of %d messages violated a constraint, retrying individually", len(rows))
+    else:
+        return
 
-    async with async_session() as sess:
-        for channel in guild.channels:
-            if isinstance(channel, discord.CategoryChannel):
-                if existing_cat := await sess.get(models.Category, str(channel.id)):
-                    existing_cat.name = channel.name
-                else:
-                    sess.add(models.Category(id=str(channel.id), name=channel.name, deleted=False))
+    for row in rows:
+        try:
+            await _fast_path.insert_messages([row])
+        except IntegrityConstraintViolationError:
+            log.debug("Discarding message %s which violated a constraint", row["id"])
 
-        await sess.commit()
 
-    log.info("Category synchronisation process complete, synchronising deleted categories")
+async def sync_channels(guild: discord.Guild) -> set[int]:
+    """
+    Sync all categories, channels and threads in the guild with the database.
+
+    Returns the IDs of every category, channel and thread that was written.
+    """
+    categories = [category_row(c) for c in guild.channels if isinstance(c, discord.CategoryChannel)]
+    channels = [
+        channel_row(c) for c in guild.channels
+        if not isinstance(c, discord.CategoryChannel) and not is_ignored(c)
+    ]
+    threads = [thread_row(t) for t in guild.threads if not is_ignored(t)]
+
+    log.info("Beginning category synchronisation process")
 
     async with async_session() as sess:
+        created, updated = await upsert_rows(models.Category, categories, CATEGORY_UPDATE_COLUMNS, sess)
+        log.info("Category upsert: inserted %d rows, updated %d rows", created, updated)
+
+        log.info("Category synchronisation process complete, synchronising deleted categories")
+
         await sess.execute(
             update(models.Category)
-            .where(~models.Category.id.in_(
-                [str(channel.id) for channel in guild.channels if isinstance(channel, discord.CategoryChannel)],
-            ))
+            .where(~models.Category.id.in_([row["id"] for row in categories]))
             .values(deleted=True),
         )
-        await sess.commit()
 
-    log.info("Deleted category synchronisation process complete, synchronising channels")
-
-    async with async_session() as sess:
-        for channel in guild.channels:
-            if channel.category and channel.category.id in BotConfig.ignore_categories:
-                continue
-
-            if not isinstance(channel, discord.CategoryChannel):
-                category_id = str(channel.category.id) if channel.category else None
-                # Cast to bool so is_staff is False if channel.category is None
-                is_staff = channel.id in BotConfig.staff_channels or bool(
-                    channel.category and channel.category.id in BotConfig.staff_categories,
-                )
-                if db_chan := await sess.get(models.Channel, str(channel.id)):
-                    db_chan.name = channel.name
-                else:
-                    sess.add(models.Channel(
-                        id=str(channel.id),
-                        name=channel.name,
-                        category_id=category_id,
-                        is_staff=is_staff,
-                        deleted=False,
-                    ))
+        log.info("Deleted category synchronisation process complete, synchronising channels")
 
-        await sess.commit()
+        created, updated = await upsert_rows(models.Channel, channels, CHANNEL_UPDATE_COLUMNS, sess)
+        log.info("Channel upsert: inserted %d rows, updated %d rows", created, updated)
 
-    log.info("Channel synchronisation process complete, synchronising deleted channels")
+        log.info("Channel synchronisation process complete, synchronising deleted channels")
 
-    async with async_session() as sess:
         await sess.execute(
             update(models.Channel)
-            .where(~models.Channel.id.in_([str(channel.id) for channel in guild.channels]))
+            .where(~models.Channel.id.in_([channel.id for channel in guild.channels]))
             .values(deleted=True),
         )
-        await sess.commit()
 
-    log.info("Deleted channel synchronisation process complete, synchronising threads")
+        log.info("Deleted channel synchronisation process complete, synchronising threads")
+
+        created, updated = await upsert_rows(models.Thread, threads, THREAD_UPDATE_COLUMNS, sess)
+        log.info("Thread upsert: inserted %d rows, updated %d rows", created, updated)
 
-    async with async_session() as sess:
-        for thread in guild.threads:
-            if thread.parent and thread.parent.category and thread.parent.category.id in BotConfig.ignore_categories:
-                continue
-
-            if db_thread := await sess.get(models.Thread, str(thread.id)):
-                db_thread.name = thread.name
-                db_thread.archived = thread.archived
-                db_thread.auto_archive_duration = thread.auto_archive_duration
-                db_thread.locked = thread.locked
-                db_thread.type = thread.type.name
-            else:
-                insert_thread(thread, sess)
         await sess.commit()
 
     log.info("Thread synchronisation process complete, synchronising deleted threads")
     await sync_thread_archive_state(guild)
     log.info("Thread synchronisation process complete, finished synchronising guild.")
-    bot.channel_sync_in_progress.set()
+
+    return {row["id"] for row in (*categories, *channels, *threads)}
 
 
 async def sync_thread_archive_state(guild: discord.Guild) -> None:
     """Sync the archive state of all threads in the database with the state in guild."""
-    active_thread_ids = [str(thread.id) for thread in guild.threads]
+    active_thread_ids = [thread.id for thread in guild.threads]
 
     async with async_session() as sess:
         await sess.execute(
@@ -157,3 +329,78 @@ async def sync_thread_archive_state(guild: discord.Guild) -> None:
             .values(archived=True),
         )
         await sess.commit()
+
+
+class ChannelSyncCoordinator:
+    """
+    Coalesce requests for a full channel sync so that at most one sync runs at a time.
+
+    A sync starts `debounce` seconds after the first request, and every request made in that window is
+    served by the same sync. Requests made while a sync is running mark the coordinator as dirty, which
+    causes exactly one more sync to run once the current one finishes.
+
+    After each successful sync a `channels_synced` event is dispatched with the IDs that were written.
+    """
+
+    def __init__(self, bot: "Bot", *, debounce: float = SyncConfig.channel_sync_debounce) -> None:
+        self.bot = bot
+        self.debounce = debounce
+
+        self.requests = 0
+        self.runs = 0
+
+        self._dirty = False
+        self._waiters: list[asyncio.Future[None]] = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def coalesced(self) -> int:
+        """The number of requests that were served by a sync started for another request."""
+        return self.requests - self.runs
+
+    def request(self) -> asyncio.Future[None]:
+        """Request a full channel sync, returning a future that resolves once a sync covering it completes."""
+        self.requests += 1
+        self._dirty = True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        if self._task is None or self._task.done():
+            self._task = scheduling.create_task(self._run(), name="channel-sync")
+
+        return waiter
+
+    async def sync(self) -> None:
+        """Request a full channel sync and wait for it to complete."""
+        await self.request()
+
+    async def _run(self) -> None:
+        """Run syncs until no requests are outstanding."""
+        while self._dirty:
+            await asyncio.sleep(self.debounce)
+
+            self._dirty = False
+            waiters, self._waiters = self._waiters, []
+            self.runs += 1
+
+            log.info(
+                "Running channel sync for %d request(s), %d request(s) coalesced in total",
+                len(waiters),
+                self.coalesced,
+            )
+
+            try:
+                synced = await sync_channels(self.bot.get_guild(self.bot.guild_id))
+            except Exception as e:
+                log.exception("Channel sync failed")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                        # Mark the exception as retrieved, fire-and-forget requests will never await it.
+                        waiter.exception()
+            else:
+                self.bot.dispatch("channels_synced", synced)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
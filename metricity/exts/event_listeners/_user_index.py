@@ -0,0 +1,94 @@
+"""An in-memory index of the users stored in the database."""
+
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from pydis_core.utils import logging
+from sqlalchemy import select
+
+from metricity.database import read_session
+from metricity.models import User
+
+log = logging.get_logger(__name__)
+
+# How long to remember that a user ID is not in the users table before checking the database again.
+NEGATIVE_CACHE_TTL = 300
+# The maximum number of user IDs to remember as not being in the users table.
+NEGATIVE_CACHE_SIZE = 10_000
+
+
+class KnownUserIndex:
+    """
+    Tracks which user IDs have a row in the users table, so that messages can be filtered without a query.
+
+    The IDs loaded from the database are stored in a sorted array of 64-bit integers, users added afterwards
+    are kept in a set. Lookups for IDs that are not known fall back to the database, and misses are cached
+    for `NEGATIVE_CACHE_TTL` seconds.
+    """
+
+    def __init__(self) -> None:
+        self._loaded = array("q")
+        self._added: set[int] = set()
+        self._unknown: OrderedDict[int, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._loaded) + len(self._added)
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._added:
+            return True
+
+        index = bisect_left(self._loaded, user_id)
+        return index < len(self._loaded) and self._loaded[index] == user_id
+
+    async def load(self, written_ids: Iterable[int] = ()) -> None:
+        """
+        Replace the index with all user IDs currently in the database.
+
+        The IDs are read from the read replica when one is available, so `written_ids` should contain any users
+        that were written just before loading, in case the replica hasn't caught up with them yet.
+        """
+        async with read_session() as sess:
+            result = await sess.stream_scalars(select(User.id))
+            user_ids = {user_id async for user_id in result}
+
+        user_ids.update(written_ids)
+        loaded = array("q", sorted(user_ids))
+
+        self._loaded = loaded
+        self._added.clear()
+        self._unknown.clear()
+
+        log.info("Loaded %d user IDs into the known user index", len(loaded))
+
+    def add(self, user_id: int) -> None:
+        """Record that the given user now has a row in the users table."""
+        self._unknown.pop(user_id, None)
+        if user_id not in self:
+            self._added.add(user_id)
+
+    async def contains(self, user_id: int) -> bool:
+        """Return whether the given user has a row in the users table, checking the database on a miss."""
+        if user_id in self:
+            return True
+
+        if (expiry := self._unknown.get(user_id)) is not None:
+            if expiry > time.monotonic():
+                return False
+            del self._unknown[user_id]
+
+        async with read_session() as sess:
+            exists = await sess.scalar(select(User.id).where(User.id == user_id))
+
+        if exists is not None:
+            self._added.add(user_id)
+            return True
+
+        self._unknown[user_id] = time.monotonic() + NEGATIVE_CACHE_TTL
+        if len(self._unknown) > NEGATIVE_CACHE_SIZE:
+            self._unknown.popitem(last=False)
+
+        return False
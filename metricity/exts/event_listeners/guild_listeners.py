@@ -1,11 +1,14 @@
 """An ext to listen for guild (and guild channel) events and syncs them to the database."""
 
+from collections.abc import Awaitable
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from pydis_core.utils import logging
+from sqlalchemy.exc import SQLAlchemyError
 
 from metricity.bot import Bot
-from metricity.config import BotConfig
+from metricity.config import BotConfig, SyncConfig
 from metricity.exts.event_listeners import _syncer_utils
 
 log = logging.get_logger(__name__)
@@ -17,13 +20,42 @@ class GuildListeners(commands.Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
+        if SyncConfig.channel_reconcile_interval > 0:
+            self.reconcile_channels.change_interval(seconds=SyncConfig.channel_reconcile_interval)
+            self.reconcile_channels.start()
+
+    async def cog_unload(self) -> None:
+        """Stop the periodic channel reconciliation."""
+        self.reconcile_channels.cancel()
+
+    @tasks.loop()
+    async def reconcile_channels(self) -> None:
+        """Periodically request a full channel sync to pick up anything the channel events missed."""
+        # The startup sync already runs a full channel sync, so skip the immediate first iteration.
+        if self.reconcile_channels.current_loop == 0:
+            return
+
+        await self.bot.sync_process_complete.wait()
+        self.bot.channel_sync.request()
+
+    async def _sync(self, targeted_sync: Awaitable[list[int] | None]) -> None:
+        """Run a targeted sync, falling back to requesting a full channel sync if it fails."""
+        try:
+            synced = await targeted_sync
+        except SQLAlchemyError:
+            log.exception("Targeted channel sync failed, requesting a full channel sync")
+            self.bot.channel_sync.request()
+        else:
+            if synced:
+                self.bot.dispatch("channels_synced", synced)
+
     @commands.Cog.listener()
     async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
-        """Sync the channels when one is created."""
+        """Sync the channel when one is created."""
         if channel.guild.id != BotConfig.guild_id:
             return
 
-        await _syncer_utils.sync_channels(self.bot, channel.guild)
+        await self._sync(_syncer_utils.sync_channel(channel))
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
@@ -31,7 +63,7 @@ class GuildListeners(commands.Cog):
         if channel.guild.id != BotConfig.guild_id:
             return
 
-        await _syncer_utils.sync_channels(self.bot, channel.guild)
+        await self._sync(_syncer_utils.mark_channel_deleted(channel))
 
     @commands.Cog.listener()
     async def on_guild_channel_update(
@@ -39,27 +71,27 @@ class GuildListeners(commands.Cog):
         _before: discord.abc.GuildChannel,
         channel: discord.abc.GuildChannel,
     ) -> None:
-        """Sync the channels when one is updated."""
+        """Sync the channel when one is updated."""
         if channel.guild.id != BotConfig.guild_id:
             return
 
-        await _syncer_utils.sync_channels(self.bot, channel.guild)
+        await self._sync(_syncer_utils.sync_channel(channel))
 
     @commands.Cog.listener()
     async def on_thread_create(self, thread: discord.Thread) -> None:
-        """Sync channels when a thread is created."""
+        """Sync the thread when one is created."""
         if thread.guild.id != BotConfig.guild_id:
             return
 
-        await _syncer_utils.sync_channels(self.bot, thread.guild)
+        await self._sync(_syncer_utils.sync_thread(thread))
 
     @commands.Cog.listener()
     async def on_thread_update(self, _before: discord.Thread, thread: discord.Thread) -> None:
-        """Sync the channels when one is updated."""
+        """Sync the thread when one is updated."""
         if thread.guild.id != BotConfig.guild_id:
             return
 
-        await _syncer_utils.sync_channels(self.bot, thread.guild)
+        await self._sync(_syncer_utils.sync_thread(thread))
 
 
 async def setup(bot: Bot) -> None:
@@ -1,16 +1,14 @@
 """An ext to listen for member events and syncs them to the database."""
 
-import contextlib
+from typing import Any
 
 import discord
-from asyncpg.exceptions import UniqueViolationError
 from discord.ext import commands
-from sqlalchemy import update
 
 from metricity.bot import Bot
-from metricity.config import BotConfig
-from metricity.database import async_session
-from metricity.models import User
+from metricity.config import BotConfig, IngestConfig
+from metricity.exts.event_listeners import _fast_path, _syncer_utils
+from metricity.exts.event_listeners._batching import BatchWriter
 
 
 class MemberListeners(commands.Cog):
@@ -18,20 +16,54 @@ class MemberListeners(commands.Cog):
 
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
+        self.member_writer: BatchWriter[int, dict[str, Any]] = BatchWriter(
+            "member",
+            self.write_members,
+            max_size=IngestConfig.member_batch_size,
+            interval=IngestConfig.member_flush_interval,
+        )
+
+    async def cog_unload(self) -> None:
+        """Write any buffered member updates before the cog is unloaded or the bot shuts down."""
+        await self.member_writer.close()
+
+    async def write_members(self, rows: list[dict[str, Any]]) -> None:
+        """Upsert a batch of buffered member rows, holding only the latest row for each member."""
+        await _fast_path.upsert_users(rows)
+
+        for row in rows:
+            self.bot.known_users.add(row["id"])
+            self.bot.user_states.set(row["id"], row["sync_digest"])
+
+    def is_buffered(self, user_id: int) -> bool:
+        """Return whether a row for the given member is waiting to be written or is being written."""
+        return self.member_writer.get(user_id) is not None or self.member_writer.is_in_flight(user_id)
+
+    async def flush_member(self, user_id: int) -> None:
+        """Make sure any buffered row for the given member has been written."""
+        if self.is_buffered(user_id):
+            await self.member_writer.flush()
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member: discord.Member) -> None:
-        """On a user leaving the server mark in_guild as False."""
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent) -> None:
+        """
+        On a user leaving the server mark in_guild as False.
+
+        The raw event is used as members who haven't been cached don't trigger `on_member_remove`.
+        """
         await self.bot.sync_process_complete.wait()
 
-        if member.guild.id != BotConfig.guild_id:
+        if payload.guild_id != BotConfig.guild_id:
             return
 
-        async with async_session() as sess:
-            await sess.execute(
-                update(User).where(User.id == str(member.id)).values(in_guild=False),
-            )
-            await sess.commit()
+        member = payload.user
+
+        # Make sure a buffered join or update for this member can't be written after they're marked as off guild.
+        await self.flush_member(member.id)
+
+        self.bot.user_states.discard(member.id)
+
+        await _fast_path.mark_user_off_guild(member.id)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
@@ -41,36 +73,7 @@ class MemberListeners(commands.Cog):
         if member.guild.id != BotConfig.guild_id:
             return
 
-        async with async_session() as sess:
-            if await sess.get(User, str(member.id)):
-                await sess.execute(update(User).where(User.id == str(member.id)).values(
-                    id=str(member.id),
-                    name=member.name,
-                    avatar_hash=getattr(member.avatar, "key", None),
-                    guild_avatar_hash=getattr(member.guild_avatar, "key", None),
-                    joined_at=member.joined_at,
-                    created_at=member.created_at,
-                    is_staff=BotConfig.staff_role_id in [role.id for role in member.roles],
-                    public_flags=dict(member.public_flags),
-                    pending=member.pending,
-                    in_guild=True,
-                ))
-            else:
-                sess.add(User(
-                    id=str(member.id),
-                    name=member.name,
-                    avatar_hash=getattr(member.avatar, "key", None),
-                    guild_avatar_hash=getattr(member.guild_avatar, "key", None),
-                    joined_at=member.joined_at,
-                    created_at=member.created_at,
-                    is_staff=BotConfig.staff_role_id in [role.id for role in member.roles],
-                    public_flags=dict(member.public_flags),
-                    pending=member.pending,
-                    in_guild=True,
-                ))
-
-            with contextlib.suppress(UniqueViolationError):
-                await sess.commit()
+        self.member_writer.add(member.id, _syncer_utils.user_row(member))
 
     @commands.Cog.listener()
     async def on_member_update(self, _before: discord.Member, member: discord.Member) -> None:
@@ -84,45 +87,13 @@ class MemberListeners(commands.Cog):
         if not member.joined_at:
             return
 
-        roles = {role.id for role in member.roles}
-
-        async with async_session() as sess:
-            if db_user := await sess.get(User, str(member.id)):
-                if (
-                    db_user.name != member.name or
-                    db_user.avatar_hash != getattr(member.avatar, "key", None) or
-                    db_user.guild_avatar_hash != getattr(member.guild_avatar, "key", None) or
-                    (BotConfig.staff_role_id in roles) != db_user.is_staff
-                    or db_user.pending is not member.pending
-                ):
-                    await sess.execute(update(User).where(User.id == str(member.id)).values(
-                        id=str(member.id),
-                        name=member.name,
-                        avatar_hash=getattr(member.avatar, "key", None),
-                        guild_avatar_hash=getattr(member.guild_avatar, "key", None),
-                        joined_at=member.joined_at,
-                        created_at=member.created_at,
-                        is_staff=BotConfig.staff_role_id in roles,
-                        public_flags=dict(member.public_flags),
-                        in_guild=True,
-                        pending=member.pending,
-                    ))
-            else:
-                sess.add(User(
-                    id=str(member.id),
-                    name=member.name,
-                    avatar_hash=getattr(member.avatar, "key", None),
-                    guild_avatar_hash=getattr(member.guild_avatar, "key", None),
-                    joined_at=member.joined_at,
-                    created_at=member.created_at,
-                    is_staff=BotConfig.staff_role_id in roles,
-                    public_flags=dict(member.public_flags),
-                    in_guild=True,
-                    pending=member.pending,
-                ))
-
-            with contextlib.suppress(UniqueViolationError):
-                await sess.commit()
+        row = _syncer_utils.user_row(member)
+        # Most updates are changes to fields we don't store, such as roles other than the staff role. The cache
+        # holds the last written state, so it can only be trusted when no newer row is waiting to be written.
+        if not self.is_buffered(member.id) and self.bot.user_states.is_unchanged(member.id, row["sync_digest"]):
+            return
+
+        self.member_writer.add(member.id, row)
 
 
 async def setup(bot: Bot) -> None:
@@ -1,14 +1,19 @@
 """An ext to listen for message events and syncs them to the database."""
 
+from collections.abc import Iterable
+from typing import Any
+
 import discord
 from discord.ext import commands
-from sqlalchemy import update
+from pydis_core.utils import logging, scheduling
+from sqlalchemy.exc import SQLAlchemyError
 
 from metricity.bot import Bot
-from metricity.config import BotConfig
-from metricity.database import async_session
-from metricity.exts.event_listeners import _syncer_utils
-from metricity.models import Message, User
+from metricity.config import BotConfig, IngestConfig
+from metricity.exts.event_listeners import _fast_path, _syncer_utils
+from metricity.exts.event_listeners._batching import BatchWriter
+
+log = logging.get_logger(__name__)
 
 
 class MessageListeners(commands.Cog):
@@ -16,6 +21,22 @@ class MessageListeners(commands.Cog):
 
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
+        self.message_writer: BatchWriter[int, dict[str, Any]] = BatchWriter(
+            "message",
+            _syncer_utils.write_messages,
+            max_size=IngestConfig.message_batch_size,
+            interval=IngestConfig.message_flush_interval,
+        )
+
+        # IDs of the channels and threads which are known to exist in the database.
+        self.synced_channels: set[int] = set()
+        # Messages waiting for their channel or thread to be synced, keyed by channel or thread ID.
+        self.parked_messages: dict[int, dict[int, dict[str, Any]]] = {}
+        self.parked_count = 0
+
+    async def cog_unload(self) -> None:
+        """Write any buffered messages before the cog is unloaded or the bot shuts down."""
+        await self.message_writer.close()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
@@ -29,40 +50,104 @@ class MessageListeners(commands.Cog):
         if message.guild.id != BotConfig.guild_id:
             return
 
-        if message.type in {discord.MessageType.thread_created, discord.MessageType.auto_moderation_action}:
+        if message.type in _syncer_utils.IGNORED_MESSAGE_TYPES:
             return
 
         await self.bot.sync_process_complete.wait()
-        await self.bot.channel_sync_in_progress.wait()
 
-        async with async_session() as sess:
-            if not await sess.get(User, str(message.author.id)):
-                return
+        cat_id = message.channel.category.id if message.channel.category else None
+        if cat_id in BotConfig.ignore_categories:
+            return
+
+        # The join of a new member is buffered, their first messages can arrive before it has been written.
+        if message.author.id not in self.bot.known_users and (members := self.bot.get_cog("MemberListeners")):
+            await members.flush_member(message.author.id)
+
+        if not await self.bot.known_users.contains(message.author.id):
+            return
+
+        row = _syncer_utils.message_row(message)
+        if message.channel.id in self.synced_channels:
+            self.message_writer.add(message.id, row)
+        else:
+            self._park_message(message, row)
+
+    def _park_message(self, message: discord.Message, row: dict[str, Any]) -> None:
+        """Hold a message until its channel or thread has been synced, syncing it if necessary."""
+        if self.parked_count >= IngestConfig.max_parked_messages:
+            log.warning("Discarding message %d, too many messages are waiting for a channel sync", message.id)
+            return
+
+        channel = message.channel
+        if channel.id not in self.parked_messages:
+            self.parked_messages[channel.id] = {}
+            scheduling.create_task(self._sync_unknown_channel(channel), name=f"sync-unknown-channel-{channel.id}")
+
+        self.parked_messages[channel.id][message.id] = row
+        self.parked_count += 1
+
+    async def _sync_unknown_channel(self, channel: discord.abc.GuildChannel | discord.Thread) -> None:
+        """Sync a channel or thread a message was received in before it was known to be in the database."""
+        try:
+            if isinstance(channel, discord.Thread):
+                synced = await _syncer_utils.sync_thread(channel)
+            else:
+                synced = await _syncer_utils.sync_channel(channel)
+        except SQLAlchemyError:
+            log.exception("Failed to sync channel %d, requesting a full channel sync", channel.id)
+            self.bot.channel_sync.request()
+            return
 
-            cat_id = message.channel.category.id if message.channel.category else None
-            if cat_id in BotConfig.ignore_categories:
-                return
+        if channel.id not in synced:
+            parked = self.parked_messages.pop(channel.id, {})
+            self.parked_count -= len(parked)
+            log.debug("Discarding %d messages from channel %d which can't be synced", len(parked), channel.id)
 
-            from_thread = isinstance(message.channel, discord.Thread)
-            await _syncer_utils.sync_message(message, sess, from_thread=from_thread)
+        self.bot.dispatch("channels_synced", synced)
 
-            await sess.commit()
+    @commands.Cog.listener()
+    async def on_channels_synced(self, channel_ids: Iterable[int]) -> None:
+        """Record channels and threads that were synced, releasing any messages that were waiting for them."""
+        for channel_id in channel_ids:
+            self.synced_channels.add(channel_id)
+
+            if parked := self.parked_messages.pop(channel_id, None):
+                self.parked_count -= len(parked)
+                for message_id, row in parked.items():
+                    self.message_writer.add(message_id, row)
+
+    async def _mark_buffered_deleted(self, message_ids: set[int]) -> None:
+        """
+        Flag messages which are still waiting to be written as deleted.
+
+        If any of the messages are part of a batch that is being written, wait for that write to
+        finish so the caller's update is applied after the insert.
+        """
+        wait_for_write = False
+        for message_id in message_ids:
+            if row := self.message_writer.get(message_id):
+                row["is_deleted"] = True
+            elif self.message_writer.is_in_flight(message_id):
+                wait_for_write = True
+
+        for parked in self.parked_messages.values():
+            for message_id in message_ids & parked.keys():
+                parked[message_id]["is_deleted"] = True
+
+        if wait_for_write:
+            await self.message_writer.flush()
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, message: discord.RawMessageDeleteEvent) -> None:
         """If a message is deleted and we have a record of it set the is_deleted flag."""
-        async with async_session() as sess:
-            await sess.execute(update(Message).where(Message.id == str(message.message_id)).values(is_deleted=True))
-            await sess.commit()
+        await self._mark_buffered_deleted({message.message_id})
+        await _fast_path.mark_messages_deleted([message.message_id])
 
     @commands.Cog.listener()
     async def on_raw_bulk_message_delete(self, messages: discord.RawBulkMessageDeleteEvent) -> None:
         """If messages are deleted in bulk and we have a record of them set the is_deleted flag."""
-        async with async_session() as sess:
-            await sess.execute(update(Message).where(
-                Message.id.in_([str(mid) for mid in messages.message_ids]),
-            ).values(is_deleted=True))
-            await sess.commit()
+        await self._mark_buffered_deleted(messages.message_ids)
+        await _fast_path.mark_messages_deleted(messages.message_ids)
 
 
 async def setup(bot: Bot) -> None:
@@ -1,130 +1,390 @@
 """An ext to sync the guild when the bot starts up."""
 
+import asyncio
 import math
 import time
+from array import array
+from datetime import UTC, datetime, timedelta
+from typing import Any
 
 import discord
 from discord.ext import commands
 from pydis_core.utils import logging, scheduling
-from sqlalchemy import column, select
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import load_only
+from sqlalchemy import BigInteger, Text, any_, bindparam, cast, column, exists, func, select, table, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import DBAPIError
 
 from metricity import models
 from metricity.bot import Bot
-from metricity.config import BotConfig
+from metricity.config import BotConfig, IngestConfig, SyncConfig
 from metricity.database import async_session
-from metricity.exts.event_listeners import _syncer_utils
+from metricity.exts.event_listeners import _history, _syncer_utils
 
 log = logging.get_logger(__name__)
 
+USER_CHUNK_SIZE = 500
+# The number of members fetched from the API before they are written when streaming members.
+USER_STREAM_BATCH_SIZE = 10_000
+USER_STAGING_TABLE = "users_staging"
+USER_COPY_COLUMNS = (
+    "id",
+    "name",
+    "avatar_hash",
+    "guild_avatar_hash",
+    "joined_at",
+    "created_at",
+    "is_staff",
+    "bot",
+    "in_guild",
+    "public_flags",
+    "pending",
+    "sync_digest",
+)
+
 
 class StartupSyncer(commands.Cog):
     """Sync the guild on bot startup."""
 
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
+        self.sync_lock = asyncio.Lock()
+        self.catch_up_started = False
         scheduling.create_task(self.sync_guild())
 
     async def sync_guild(self) -> None:
-        """Sync all channels and members in the guild."""
+        """
+        Sync all channels and members in the guild, one sync at a time.
+
+        A sync is started both when the cog is loaded and by `on_guild_available`. Only the first sync catches up
+        on missed messages, as later syncs run while live messages are already being written.
+        """
+        async with self.sync_lock:
+            catch_up = SyncConfig.catch_up_lookback > 0 and not self.catch_up_started
+            self.catch_up_started = True
+            await self.sync_guild_once(catch_up=catch_up)
+
+    async def sync_guild_once(self, *, catch_up: bool) -> None:
+        """Sync all channels and members in the guild, then start the catch-up if requested."""
         await self.bot.wait_until_guild_available()
 
         guild = self.bot.get_guild(self.bot.guild_id)
-        await _syncer_utils.sync_channels(self.bot, guild)
+        await self.bot.channel_sync.sync()
 
         log.info("Beginning thread archive state synchronisation process")
         await _syncer_utils.sync_thread_archive_state(guild)
 
         log.info("Beginning user synchronisation process")
-        users = (
-            {
-                "id": str(user.id),
-                "name": user.name,
-                "avatar_hash": getattr(user.avatar, "key", None),
-                "guild_avatar_hash": getattr(user.guild_avatar, "key", None),
-                "joined_at": user.joined_at,
-                "created_at": user.created_at,
-                "is_staff": BotConfig.staff_role_id in [role.id for role in user.roles],
-                "bot": user.bot,
-                "in_guild": True,
-                "public_flags": dict(user.public_flags),
-                "pending": user.pending,
-            }
-            for user in guild.members
-        )
+        if SyncConfig.stream_members:
+            member_ids, digests = await self.stream_users(guild)
+        else:
+            member_ids, digests = await self.sync_cached_users(guild)
 
-        user_chunks = discord.utils.as_chunks(users, 500)
-        created = 0
-        updated = 0
-        total_users = len(guild.members)
-
-        log.info("Performing bulk upsert of %d rows in %d chunks", total_users, math.ceil(total_users / 500))
-
-        async with async_session() as sess:
-            for chunk in user_chunks:
-                qs = insert(models.User).returning(column("xmax")).values(chunk)
-
-                update_cols = [
-                    "name",
-                    "avatar_hash",
-                    "guild_avatar_hash",
-                    "joined_at",
-                    "is_staff",
-                    "bot",
-                    "in_guild",
-                    "public_flags",
-                    "pending",
-                ]
-
-                res = await sess.execute(qs.on_conflict_do_update(
-                    index_elements=[models.User.id],
-                    set_={k: getattr(qs.excluded, k) for k in update_cols},
-                ))
-
-                objs = list(res)
-                created += [obj[0] == 0 for obj in objs].count(True)
-                updated += [obj[0] != 0 for obj in objs].count(True)
-
-                log.info("User upsert: inserted %d rows, updated %d rows, done %d rows, %d rows remaining",
-                         created, updated, created + updated, total_users - (created + updated))
-
-            await sess.commit()
+        self.bot.user_states.warm(zip(member_ids, digests, strict=True))
 
         log.info("User upsert complete")
         log.info("Beginning user in_guild sync")
 
-        users_updated = 0
-        guild_member_ids = {str(member.id) for member in guild.members}
         async with async_session() as sess:
             start = time.perf_counter()
 
-            stmt = select(models.User).filter_by(in_guild=True).options(load_only(models.User.id))
-            res = await sess.execute(stmt)
-            in_guild_users = res.scalars()
-            query = time.perf_counter()
-
-            for user in in_guild_users:
-                if user.id not in guild_member_ids:
-                    users_updated += 1
-                    user.in_guild = False
+            # Mark every user that is in_guild but isn't in the current member list as off guild,
+            # in a single anti-join against the array of member IDs.
+            members = (
+                func.unnest(bindparam("member_ids", list(member_ids), type_=ARRAY(BigInteger)))
+                .table_valued("id")
+                .render_derived(name="members")
+            )
             proc = time.perf_counter()
 
+            res = await sess.execute(
+                update(models.User)
+                .where(models.User.in_guild.is_(True), ~exists().where(members.c.id == models.User.id))
+                .values(in_guild=False)
+                .execution_options(synchronize_session=False),
+            )
+            users_updated = res.rowcount
+            query = time.perf_counter()
+
             await sess.commit()
             end = time.perf_counter()
 
             log.debug(
                 "in_guild sync: total time %fs, query %fs, processing %fs, commit %fs",
                 end - start,
-                query - start,
-                proc - query,
-                end - proc,
+                query - proc,
+                proc - start,
+                end - query,
             )
         log.info("User in_guild sync updated %d users to be off guild", users_updated)
-        log.info("User sync complete")
+        log.info("User sync complete, loading known user index")
+
+        await self.bot.known_users.load(member_ids)
+
+        # The marks are read while live messages are still held, as writing them raises the marks past the gap.
+        if catch_up:
+            async with async_session() as sess:
+                res = await sess.execute(
+                    select(models.ChannelHighWaterMark.channel_id, models.ChannelHighWaterMark.last_message_id),
+                )
+                marks = dict(res.tuples().all())
 
         self.bot.sync_process_complete.set()
 
+        if catch_up:
+            scheduling.create_task(self.catch_up_messages(guild, marks), name="catch-up-messages")
+
+    async def catch_up_messages(self, guild: discord.Guild, marks: dict[int, int]) -> None:
+        """
+        Fetch and write the messages sent while the bot was offline, starting after each channel's high water mark.
+
+        `marks` must be read before live messages are written, otherwise the gap would already be covered by them.
+        Channels are skipped without a request when their cached last message is not newer than the high water
+        mark. Nothing older than `catch_up_lookback` seconds is fetched, so channels without a mark, or which
+        were quiet for longer than that, only have their recent messages fetched.
+        """
+        start = time.perf_counter()
+        lookback_floor = discord.utils.time_snowflake(
+            datetime.now(UTC) - timedelta(seconds=SyncConfig.catch_up_lookback),
+        )
+
+        behind = []
+        for channel_id, channel in _history.history_channels(guild).items():
+            after = max(marks.get(channel_id, 0), lookback_floor)
+            if channel.last_message_id is not None and channel.last_message_id > after:
+                behind.append((channel, after))
+
+        log.info("Catching up on missed messages in %d channels and threads", len(behind))
+
+        semaphore = asyncio.Semaphore(SyncConfig.catch_up_concurrency)
+
+        async def catch_up_channel(channel: _history.HistoryChannel, after: int) -> int:
+            async with semaphore:
+                try:
+                    return await self.catch_up_channel(channel, after)
+                except discord.HTTPException:
+                    log.exception("Failed to catch up on missed messages in channel %d", channel.id)
+                    return 0
+
+        written = await asyncio.gather(*(catch_up_channel(channel, after) for channel, after in behind))
+
+        log.info(
+            "Caught up on %d missed messages in %d channels and threads in %fs",
+            sum(written),
+            len(behind),
+            time.perf_counter() - start,
+        )
+
+    async def catch_up_channel(self, channel: _history.HistoryChannel, after: int) -> int:
+        """Write the messages sent in a channel after the given message ID, returning the number written."""
+        written = 0
+        rows = []
+
+        async for message in channel.history(limit=None, after=discord.Object(after), oldest_first=True):
+            rows.extend(await _history.stored_rows(self.bot, (message,)))
+
+            if len(rows) >= IngestConfig.message_batch_size:
+                await _syncer_utils.write_messages(rows)
+                written += len(rows)
+                rows = []
+
+        if rows:
+            await _syncer_utils.write_messages(rows)
+            written += len(rows)
+
+        return written
+
+    async def sync_cached_users(self, guild: discord.Guild) -> tuple[array, array]:
+        """Write every member in the guild's member cache, returning the member IDs and their fingerprints."""
+        users = [_syncer_utils.user_row(member) for member in guild.members]
+        await self.write_users(users)
+
+        return array("q", (member.id for member in guild.members)), array("q", (u["sync_digest"] for u in users))
+
+    async def stream_users(self, guild: discord.Guild) -> tuple[array, array]:
+        """
+        Fetch members from the API page by page and write them as they arrive, returning their IDs and fingerprints.
+
+        This is used when the member cache isn't populated at startup. Only the member IDs and fingerprints are
+        kept for the whole sync, the members themselves are discarded once their batch has been written. Each
+        batch is written while the next one is being fetched.
+        """
+        member_ids = array("q")
+        digests = array("q")
+        batch = []
+        write: asyncio.Task | None = None
+
+        log.info("Streaming %d members from the API in batches of %d", guild.member_count, USER_STREAM_BATCH_SIZE)
+
+        async for member in guild.fetch_members(limit=None):
+            row = _syncer_utils.user_row(member)
+            member_ids.append(member.id)
+            digests.append(row["sync_digest"])
+            batch.append(row)
+
+            if len(batch) >= USER_STREAM_BATCH_SIZE:
+                if write is not None:
+                    await write
+                write = asyncio.create_task(self.write_users(batch))
+                batch = []
+
+        if write is not None:
+            await write
+        if batch:
+            await self.write_users(batch)
+
+        log.info("Streamed %d members", len(member_ids))
+        return member_ids, digests
+
+    async def write_users(self, users: list[dict[str, Any]]) -> None:
+        """Write the given user rows with the configured sync method, skipping unchanged users if enabled."""
+        if SyncConfig.user_sync_digests:
+            users = await self.changed_users(users)
+
+        if SyncConfig.user_sync_method == "copy":
+            await self.copy_users(users)
+        else:
+            await self.upsert_users(users)
+
+    async def changed_users(self, users: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Return the user rows whose fingerprint differs from the sync digest stored for that user.
+
+        Digests are cleared whenever anything else updates a user row, and users who are not in_guild are
+        always synced. If no digests are stored every row is returned, resulting in a full sync.
+        """
+        user_ids = [user["id"] for user in users]
+        async with async_session() as sess:
+            res = await sess.execute(
+                select(models.User.id, models.User.sync_digest)
+                .where(
+                    models.User.id == any_(bindparam("user_ids", user_ids, type_=ARRAY(BigInteger))),
+                    models.User.in_guild.is_(True),
+                    models.User.sync_digest.is_not(None),
+                ),
+            )
+            digests = dict(res.tuples().all())
+
+        changed = [user for user in users if digests.get(user["id"]) != user["sync_digest"]]
+        log.info(
+            "Skipping %d users with unchanged sync digests, %d users to sync",
+            len(users) - len(changed),
+            len(changed),
+        )
+        return changed
+
+    async def upsert_users(self, users: list[dict[str, Any]]) -> None:
+        """
+        Insert or update the given user rows with chunked INSERT ... ON CONFLICT DO UPDATE statements.
+
+        With a `user_sync_concurrency` of 1 the chunks are sent in order in a single transaction. Otherwise
+        up to that many chunks are sent at once over separate pooled connections, each chunk in its own
+        transaction and retried up to `user_sync_retries` times.
+        """
+        user_chunks = list(discord.utils.as_chunks(users, USER_CHUNK_SIZE))
+        total_users = len(users)
+        created = 0
+        updated = 0
+
+        log.info(
+            "Performing bulk upsert of %d rows in %d chunks",
+            total_users,
+            math.ceil(total_users / USER_CHUNK_SIZE),
+        )
+
+        def log_progress(chunk_created: int, chunk_updated: int) -> None:
+            nonlocal created, updated
+            created += chunk_created
+            updated += chunk_updated
+            log.info("User upsert: inserted %d rows, updated %d rows, done %d rows, %d rows remaining",
+                     created, updated, created + updated, total_users - (created + updated))
+
+        if SyncConfig.user_sync_concurrency <= 1:
+            async with async_session() as sess:
+                for chunk in user_chunks:
+                    log_progress(*await _syncer_utils.upsert_rows(
+                        models.User, chunk, _syncer_utils.USER_UPDATE_COLUMNS, sess,
+                    ))
+
+                await sess.commit()
+            return
+
+        semaphore = asyncio.Semaphore(SyncConfig.user_sync_concurrency)
+
+        async def upsert_chunk(chunk: list[dict[str, Any]]) -> None:
+            async with semaphore:
+                log_progress(*await self._upsert_user_chunk(chunk))
+
+        await asyncio.gather(*(upsert_chunk(chunk) for chunk in user_chunks))
+
+    async def _upsert_user_chunk(self, chunk: list[dict[str, Any]]) -> tuple[int, int]:
+        """Upsert a chunk of user rows in its own transaction, retrying on database errors."""
+        for attempt in range(1, SyncConfig.user_sync_retries):
+            try:
+                return await self._upsert_user_chunk_once(chunk)
+            except DBAPIError:
+                log.warning(
+                    "User upsert chunk failed on attempt %d of %d, retrying",
+                    attempt,
+                    SyncConfig.user_sync_retries,
+                    exc_info=True,
+                )
+                await asyncio.sleep(2 ** attempt)
+
+        return await self._upsert_user_chunk_once(chunk)
+
+    async def _upsert_user_chunk_once(self, chunk: list[dict[str, Any]]) -> tuple[int, int]:
+        """Upsert a chunk of user rows in its own transaction."""
+        async with async_session() as sess:
+            result = await _syncer_utils.upsert_rows(models.User, chunk, _syncer_utils.USER_UPDATE_COLUMNS, sess)
+            await sess.commit()
+
+        return result
+
+    async def copy_users(self, users: list[dict[str, Any]]) -> None:
+        """
+        Insert or update the given user rows by copying them into a staging table and merging it into users.
+
+        The rows are streamed into a temporary table with asyncpg's binary COPY, then merged with a single
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE statement in the same transaction.
+        """
+        log.info("Performing bulk copy of %d rows into %s", len(users), USER_STAGING_TABLE)
+
+        records = (
+            tuple(user[col] for col in USER_COPY_COLUMNS)
+            for user in users
+        )
+
+        async with async_session() as sess:
+            await sess.execute(text(
+                f"CREATE TEMPORARY TABLE {USER_STAGING_TABLE} (LIKE users INCLUDING DEFAULTS) ON COMMIT DROP",
+            ))
+
+            conn = await sess.connection()
+            raw_conn = await conn.get_raw_connection()
+            await raw_conn.driver_connection.copy_records_to_table(
+                USER_STAGING_TABLE,
+                records=records,
+                columns=USER_COPY_COLUMNS,
+            )
+
+            log.info("User copy complete, merging %s into users", USER_STAGING_TABLE)
+
+            staging = table(USER_STAGING_TABLE, *(column(col) for col in USER_COPY_COLUMNS))
+            qs = insert(models.User).from_select(USER_COPY_COLUMNS, select(staging))
+            upserted = qs.on_conflict_do_update(
+                index_elements=[models.User.id],
+                set_={k: getattr(qs.excluded, k) for k in _syncer_utils.USER_UPDATE_COLUMNS},
+            ).returning(column("xmax")).cte("upserted")
+
+            res = await sess.execute(select(
+                func.count().filter(cast(upserted.c.xmax, Text) == "0"),
+                func.count(),
+            ))
+            created, total = res.one()
+            await sess.commit()
+
+        log.info("User merge: inserted %d rows, updated %d rows", created, total - created)
+
     @commands.Cog.listener()
     async def on_guild_available(self, guild: discord.Guild) -> None:
         """Synchronize the user table with the Discord users."""
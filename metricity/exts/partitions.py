@@ -0,0 +1,130 @@
+"""Create upcoming partitions of the messages table and report on their sizes."""
+
+from datetime import UTC, datetime
+
+import discord
+from discord.ext import commands, tasks
+from pydis_core.utils import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from metricity.bot import Bot
+from metricity.config import BotConfig, PartitionConfig
+from metricity.database import async_session, read_session
+
+log = logging.get_logger(__name__)
+
+# Raised when a new partition would overlap an existing one, such as the partition holding the legacy messages.
+INVALID_OBJECT_DEFINITION = "42P17"
+
+PARTITION_SIZES_QUERY = text("""
+    SELECT
+        partition.relname,
+        pg_get_expr(partition.relpartbound, partition.oid),
+        pg_total_relation_size(partition.oid),
+        partition.reltuples::bigint
+    FROM pg_inherits
+    JOIN pg_class AS partition ON partition.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'messages'::regclass
+    ORDER BY partition.relname
+""")
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    """Return the start of the month the given number of months after the given month."""
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=month_index + 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Return the name of the messages partition for the given month."""
+    return f"messages_y{month.year}m{month.month:02d}"
+
+
+def format_size(size: int) -> str:
+    """Format a size in bytes for humans."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:  # noqa: PLR2004
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class PartitionManager(commands.Cog):
+    """Make sure the partitions messages will be written to exist ahead of time."""
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+
+        self.maintain_partitions.change_interval(seconds=PartitionConfig.maintenance_interval)
+        self.maintain_partitions.start()
+
+    async def cog_unload(self) -> None:
+        """Stop the periodic partition maintenance."""
+        self.maintain_partitions.cancel()
+
+    @tasks.loop()
+    async def maintain_partitions(self) -> None:
+        """Create any missing partitions, from the current month up to `premake_months` months ahead."""
+        this_month = datetime.now(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        for months in range(PartitionConfig.premake_months + 1):
+            await self.create_partition(add_months(this_month, months))
+
+        async with read_session() as sess:
+            partitions = (await sess.execute(PARTITION_SIZES_QUERY)).all()
+
+        for name, _, size, rows in partitions:
+            log.info("Partition %s: %s, approximately %d rows", name, format_size(size), max(rows, 0))
+
+    @maintain_partitions.error
+    async def on_maintenance_error(self, error: Exception) -> None:
+        """Log failures of the partition maintenance, it will be retried on the next iteration."""
+        log.error("Partition maintenance failed", exc_info=error)
+
+    async def create_partition(self, month: datetime) -> None:
+        """Create the messages partition for the given month if it doesn't already exist."""
+        name = partition_name(month)
+        start = month.isoformat()
+        end = add_months(month, 1).isoformat()
+
+        try:
+            async with async_session() as sess:
+                await sess.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages FOR VALUES FROM ('{start}') TO ('{end}')",
+                ))
+                await sess.commit()
+        except DBAPIError as e:
+            if getattr(e.orig, "pgcode", None) != INVALID_OBJECT_DEFINITION:
+                raise
+            log.debug("Not creating partition %s, the month is covered by another partition", name)
+
+    @commands.command()
+    @commands.has_any_role(BotConfig.staff_role_id)
+    @commands.guild_only()
+    async def partitions(self, ctx: commands.Context) -> None:
+        """Respond with the size of each partition of the messages table."""
+        if ctx.guild.id != BotConfig.guild_id:
+            return
+
+        async with read_session() as sess:
+            partitions = (await sess.execute(PARTITION_SIZES_QUERY)).all()
+
+        lines = [
+            f"`{name}` {format_size(size)}, ~{max(rows, 0):,} rows\n{bounds}"
+            for name, bounds, size, rows in partitions
+        ]
+        total = sum(size for _, _, size, _ in partitions)
+
+        embed = discord.Embed(
+            title="Message partitions",
+            description="\n".join(lines),
+        )
+        embed.set_footer(text=f"{len(partitions)} partitions, {format_size(total)} in total")
+
+        await ctx.send(embed=embed)
+
+
+async def setup(bot: Bot) -> None:
+    """Load the PartitionManager cog."""
+    await bot.add_cog(PartitionManager(bot))
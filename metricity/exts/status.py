@@ -5,6 +5,7 @@ import discord
 from discord.ext import commands
 
 from metricity.config import BotConfig
+from metricity.database import pool_status
 
 DESCRIPTIONS = (
     "Command processing time",
@@ -52,6 +53,17 @@ class Status(commands.Cog):
         for desc, latency in zip(DESCRIPTIONS, (bot_ping, last_event, discord_ping), strict=True):
             embed.add_field(name=desc, value=latency, inline=False)
 
+        pool = pool_status()
+        embed.add_field(
+            name="Database pool",
+            value=(
+                f"{pool['size']} pooled, {pool['checked_out']} checked out, {max(pool['overflow'], 0)} overflow\n"
+                f"Checkout wait: {pool['mean_wait'] * 1000:.{ROUND_LATENCY}f} ms mean, "
+                f"{pool['max_wait'] * 1000:.{ROUND_LATENCY}f} ms max, {pool['timeouts']} timeouts"
+            ),
+            inline=False,
+        )
+
         await ctx.send(embed=embed)
 
 
@@ -1,12 +1,10 @@
 """Database models used by Metricity for statistic collection."""
 
-from datetime import UTC, datetime
+from datetime import UTC, date, datetime
 
-from sqlalchemy import ForeignKey, JSON
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, LargeBinary, func, null, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from metricity.database import TZDateTime
-
 
 class Base(DeclarativeBase):
     """Base class for all database models."""
@@ -17,7 +15,7 @@ class Category(Base):
 
     __tablename__ = "categories"
 
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     name: Mapped[str]
     deleted: Mapped[bool] = mapped_column(default=False)
 
@@ -27,9 +25,9 @@ class Channel(Base):
 
     __tablename__ = "channels"
 
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     name: Mapped[str]
-    category_id: Mapped[str | None] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"))
+    category_id: Mapped[int | None] = mapped_column(BigInteger, ForeignKey("categories.id", ondelete="CASCADE"))
     is_staff: Mapped[bool]
     deleted: Mapped[bool] = mapped_column(default=False)
 
@@ -39,9 +37,9 @@ class Thread(Base):
 
     __tablename__ = "threads"
 
-    id: Mapped[str] = mapped_column(primary_key=True)
-    parent_channel_id: Mapped[str] = mapped_column(ForeignKey("channels.id", ondelete="CASCADE"))
-    created_at = mapped_column(TZDateTime(), default=datetime.now(UTC))
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    parent_channel_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("channels.id", ondelete="CASCADE"))
+    created_at = mapped_column(DateTime(timezone=True), default=datetime.now(UTC))
     name: Mapped[str]
     archived: Mapped[bool]
     auto_archive_duration: Mapped[int]
@@ -53,29 +51,96 @@ class User(Base):
     """Database model representing a Discord user."""
 
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_in_guild_joined_at", "joined_at", postgresql_where=text("in_guild")),
+    )
 
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
     avatar_hash: Mapped[str] = mapped_column(nullable=True)
     guild_avatar_hash: Mapped[str] = mapped_column(nullable=True)
-    joined_at = mapped_column(TZDateTime(), nullable=False)
-    created_at = mapped_column(TZDateTime(), nullable=False)
+    joined_at = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at = mapped_column(DateTime(timezone=True), nullable=False)
     is_staff: Mapped[bool] = mapped_column(nullable=False)
     bot: Mapped[bool] = mapped_column(default=False)
     in_guild: Mapped[bool] = mapped_column(default=False)
-    public_flags = mapped_column(JSON, default={})
+    public_flags: Mapped[int] = mapped_column(BigInteger, default=0)
     pending: Mapped[bool] = mapped_column(default=False)
+    # Fingerprint of the member state last written by the startup sync, cleared by any other update to the row.
+    sync_digest: Mapped[int | None] = mapped_column(BigInteger, onupdate=null())
 
 
 class Message(Base):
     """Database model representing a message sent in a Discord server."""
 
     __tablename__ = "messages"
-
-    id: Mapped[str] = mapped_column(primary_key=True)
-    channel_id: Mapped[str] = mapped_column(ForeignKey("channels.id", ondelete="CASCADE"), index=True)
-    thread_id: Mapped[str | None] = mapped_column(ForeignKey("threads.id", ondelete="CASCADE"), index=True)
-    author_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
-    created_at = mapped_column(TZDateTime())
+    __table_args__ = (
+        Index("ix_messages_channel_id_created_at", "channel_id", "created_at"),
+        Index("ix_messages_author_id_created_at", "author_id", "created_at"),
+        Index("ix_messages_created_at_brin", "created_at", postgresql_using="brin"),
+        Index("ix_messages_not_deleted_created_at", "created_at", postgresql_where=text("NOT is_deleted")),
+        Index("ix_messages_content_hash", "content_hash", postgresql_using="hash"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    channel_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("channels.id", ondelete="CASCADE"))
+    thread_id: Mapped[int | None] = mapped_column(BigInteger, ForeignKey("threads.id", ondelete="CASCADE"), index=True)
+    author_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
     is_deleted: Mapped[bool] = mapped_column(default=False)
-    content_hash: Mapped[str] = mapped_column(nullable=True)
+    content_hash: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+
+
+class ChannelActivityHourly(Base):
+    """Database model rolling up the messages sent in each channel or thread per hour."""
+
+    __tablename__ = "channel_activity_hourly"
+    __table_args__ = (
+        Index("ix_channel_activity_hourly_channel_id", "channel_id", "hour"),
+    )
+
+    hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # 0 for messages which weren't sent in a thread.
+    thread_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, server_default="0")
+    message_count: Mapped[int] = mapped_column(server_default="0")
+    deleted_count: Mapped[int] = mapped_column(server_default="0")
+
+
+class UserActivityDaily(Base):
+    """Database model rolling up the messages sent by each user per day."""
+
+    __tablename__ = "user_activity_daily"
+    __table_args__ = (
+        Index("ix_user_activity_daily_user_id", "user_id", "day"),
+    )
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    message_count: Mapped[int] = mapped_column(server_default="0")
+    deleted_count: Mapped[int] = mapped_column(server_default="0")
+
+
+class BackfillCheckpoint(Base):
+    """Database model recording how far back the message history of a channel or thread has been backfilled."""
+
+    __tablename__ = "backfill_checkpoints"
+
+    # The ID of the channel or thread.
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # The oldest message fetched so far, the backfill resumes from the messages before it.
+    oldest_message_id: Mapped[int | None] = mapped_column(BigInteger)
+    completed: Mapped[bool] = mapped_column(server_default="false")
+    messages_written: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChannelHighWaterMark(Base):
+    """Database model recording the newest message stored for each channel or thread."""
+
+    __tablename__ = "channel_high_water_marks"
+
+    # The ID of the channel or thread.
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    last_message_id: Mapped[int] = mapped_column(BigInteger)
@@ -0,0 +1,109 @@
+"""Rebuild the activity rollup tables from the messages table, one day at a time."""
+
+import argparse
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import discord
+from sqlalchemy import text
+
+from metricity.database import async_session
+from metricity.exts.partitions import add_months
+
+# Writes to the rollups wait while a day is rebuilt, so that messages written during the rebuild are neither
+# lost nor counted twice. Each day is rebuilt in its own transaction, so live writes are only held for as long as
+# one day of messages takes to aggregate. Reads of the rollups aren't blocked.
+LOCK_ROLLUPS = text("LOCK TABLE channel_activity_hourly, user_activity_daily IN EXCLUSIVE MODE")
+CLEAR_CHANNEL_ACTIVITY = text("DELETE FROM channel_activity_hourly WHERE hour >= :start AND hour < :end")
+CLEAR_USER_ACTIVITY = text("DELETE FROM user_activity_daily WHERE day >= :start_day AND day < :end_day")
+ROLLUP_CHANNEL_ACTIVITY = text("""
+    INSERT INTO channel_activity_hourly (hour, channel_id, thread_id, message_count, deleted_count)
+    SELECT
+        date_trunc('hour', created_at, 'UTC'), channel_id, coalesce(thread_id, 0),
+        count(*), count(*) FILTER (WHERE is_deleted)
+    FROM messages
+    WHERE created_at >= :start AND created_at < :end
+    GROUP BY 1, 2, 3
+""")
+ROLLUP_USER_ACTIVITY = text("""
+    INSERT INTO user_activity_daily (day, user_id, message_count, deleted_count)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, author_id, count(*), count(*) FILTER (WHERE is_deleted)
+    FROM messages
+    WHERE created_at >= :start AND created_at < :end
+    GROUP BY 1, 2
+""")
+
+
+def parse_month(value: str) -> datetime:
+    """Parse a YYYY-MM month into the UTC datetime the month starts at."""
+    return datetime.strptime(value, "%Y-%m").replace(tzinfo=UTC)
+
+
+async def first_message_month() -> datetime | None:
+    """Return the start of the month the oldest stored message was sent in."""
+    async with async_session() as sess:
+        first_id = await sess.scalar(text("SELECT min(id) FROM messages"))
+
+    if first_id is None:
+        return None
+    return discord.utils.snowflake_time(first_id).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+async def rebuild_day(start: datetime) -> tuple[int, int]:
+    """
+    Replace the rollups of the day starting at the given time with ones calculated from the messages table.
+
+    Returns the number of channel hours and user days written.
+    """
+    end = start + timedelta(days=1)
+    params = {"start": start, "end": end, "start_day": start.date(), "end_day": end.date()}
+
+    async with async_session() as sess:
+        await sess.execute(LOCK_ROLLUPS)
+        await sess.execute(CLEAR_CHANNEL_ACTIVITY, params)
+        await sess.execute(CLEAR_USER_ACTIVITY, params)
+        channel_rows = (await sess.execute(ROLLUP_CHANNEL_ACTIVITY, params)).rowcount
+        user_rows = (await sess.execute(ROLLUP_USER_ACTIVITY, params)).rowcount
+        await sess.commit()
+
+    return channel_rows, user_rows
+
+
+async def rebuild_month(start: datetime) -> None:
+    """Replace the rollups of the month starting at the given time, one day at a time."""
+    end = add_months(start, 1)
+    channel_rows = user_rows = 0
+
+    day = start
+    while day < end:
+        day_channel_rows, day_user_rows = await rebuild_day(day)
+        channel_rows += day_channel_rows
+        user_rows += day_user_rows
+        day += timedelta(days=1)
+
+    print(f"Rebuilt {start:%Y-%m}: {channel_rows} channel hours, {user_rows} user days.")  # noqa: T201
+
+
+async def rebuild_rollups(since: datetime | None) -> None:
+    """Rebuild the rollups of every month from `since`, or the first stored message, up to the current month."""
+    month = since or await first_message_month()
+    if month is None:
+        print("There are no messages to roll up.")  # noqa: T201
+        return
+
+    current_month = datetime.now(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= current_month:
+        await rebuild_month(month)
+        month = add_months(month, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--since",
+        type=parse_month,
+        help="The first month to rebuild, as YYYY-MM. Defaults to the month of the oldest stored message.",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(rebuild_rollups(args.since))